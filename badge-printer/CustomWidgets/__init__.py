@@ -1,4 +1,4 @@
-import base64
+import tempfile, json
 
 from PyQt5 import QtCore, QtGui, QtWidgets, uic
 from PyQt5 import QtWebEngineWidgets
@@ -35,33 +35,43 @@ class LineEditSubmitter(QtWidgets.QLineEdit):
 class WebViewer(QtWebEngineWidgets.QWebEngineView):
 	documentReady = QtCore.pyqtSignal(object)
 
+	# QWebEngineView.setContent() refuses anything larger than 2MB
+	MAX_CONTENT_SIZE = 2 * 1024 * 1024 - 1024
+
 	def __init__(self, parent):
 		super().__init__(parent)
 		self.loadFinished.connect(self._contentLoaded)
+		self._documentFile = None
+		self._loading = False
+		self._pendingTexts = {}
+		self._pendingImages = {}
+		self._pendingMarkup = {}
 		self._css = '''
-			<style>
-				@media screen {
-					svg {
-						background: ''' + self.palette().color(self.backgroundRole()).name() + ''';
-						margin: auto;
-						margin-top: 2%;
-						height: 96%;
-						width: auto;
-						max-width: 96%;
-					}
+			@media screen {
+				svg {
+					background: ''' + self.palette().color(self.backgroundRole()).name() + ''';
+					margin: auto;
+					margin-top: 2%;
+					height: 96%;
+					width: auto;
+					max-width: 96%;
 				}
-			</style>
+			}
 		'''
 		self._css = self._css.replace('\n', '').replace('\t', '')
 
-	def _contentLoaded(self):
-		def emitIfReady(content):
-			if content != '<html><head></head><body></body></html>':
-
-				self.runJS('document.documentElement.innerHTML += "' + self._css + '";')
-				self.documentReady.emit(content)
-
-		self.processContent(emitIfReady)
+	def _contentLoaded(self, ok):
+		self._loading = False
+		if ok:
+			js = '''
+				var style = document.createElementNS("http://www.w3.org/2000/svg", "style");
+				style.textContent = "%s";
+				document.documentElement.appendChild(style);
+			'''
+			self.runJS(js % self._css)
+			# changes made while the document was loading
+			self.updateDocument()
+			self.documentReady.emit(ok)
 
 	def runJS(self, js, callback=None):
 		if callback is not None:
@@ -69,47 +79,205 @@ class WebViewer(QtWebEngineWidgets.QWebEngineView):
 		else:
 			self.page().runJavaScript(js)
 
-	def setText(self, id, text, callback=None):
-		# QtWebEngine cannot access page elements...
-		# But it can run arbirtary javascript!
-		js = '''
-			var el = document.getElementById("%s");
-			if(el) el.firstChild.textContent = "%s";
-		'''
-		self.runJS(js % (id, text), callback)
+	# Applies text and image changes to the loaded document with a single call into the page.
+	# texts maps element ids to text, images maps element ids to an image URL.
+	# markup replaces an element (and any lines it was wrapped onto), for text that's been fitted
+	def updateDocument(self, texts=None, images=None, markup=None):
+		self._pendingTexts.update(texts or {})
+		self._pendingImages.update(images or {})
+		self._pendingMarkup.update(markup or {})
+		if self._loading or (len(self._pendingTexts) == 0 and len(self._pendingImages) == 0 and len(self._pendingMarkup) == 0):
+			return
 
-	#	type should be "png" or "jpeg"
-	def setImage(self, id, data, imageType, callback=None):
-		data = 'data:image/%s;base64,%s' % (imageType, base64.b64encode(data).decode('ascii'))
 		js = '''
-			var el = document.getElementById("%s");
-			if(el) el.setAttribute("xlink:href", "%s");
+			(function(texts, images, markup){
+				for(var id in texts){
+					var el = document.getElementById(id);
+					if(el) (el.firstChild || el).textContent = texts[id];
+				}
+				for(var id in markup){
+					var el = document.getElementById(id);
+					if(!el) continue;
+					var lines = document.querySelectorAll('[data-line-of="' + CSS.escape(id) + '"]');
+					for(var i = 0; i < lines.length; i++) lines[i].remove();
+					el.outerHTML = markup[id];
+				}
+				for(var id in images){
+					var el = document.getElementById(id);
+					if(el) el.setAttributeNS("http://www.w3.org/1999/xlink", "xlink:href", images[id]);
+				}
+			})(%s, %s, %s);
 		'''
-		self.runJS(js % (id, data), callback)
+		self.runJS(js % (json.dumps(self._pendingTexts), json.dumps(self._pendingImages), json.dumps(self._pendingMarkup)))
+		self._pendingTexts = {}
+		self._pendingImages = {}
+		self._pendingMarkup = {}
+
+	# content is the serialized SVG document, as produced by template.BadgeTemplate
+	def setDocument(self, content, baseUrl=QtCore.QUrl()):
+		# the new document already has every change made so far
+		self._loading = True
+		self._pendingTexts = {}
+		self._pendingImages = {}
+		self._pendingMarkup = {}
+		if len(content) <= WebViewer.MAX_CONTENT_SIZE:
+			self.setContent(QtCore.QByteArray(content), 'image/svg+xml', baseUrl)
+		else:
+			if self._documentFile is None:
+				self._documentFile = tempfile.NamedTemporaryFile(suffix='.svg')
+			self._documentFile.seek(0)
+			self._documentFile.truncate()
+			self._documentFile.write(content)
+			self._documentFile.flush()
+			self.setUrl(QtCore.QUrl.fromLocalFile(self._documentFile.name))
 
-	def processContent(self, processFunction):
-		def stripCSS(content):
-			processFunction(content.replace(self._css, ''))
+# Finds old badges as you type, newest first
+class ArchiveSearchDialog(QtWidgets.QDialog):
+	reprintRequested = QtCore.pyqtSignal(object)
 
-		self.runJS('document.documentElement.outerHTML', stripCSS)
+	def __init__(self, archive, parent=None):
+		super().__init__(parent)
+		self.archive = archive
+		self.setWindowTitle('Reprint from archive')
+		self.resize(480, 360)
 
-	def extractTags(self, tagName, attributes, processFunction):
-		attributes.insert(0, 'id')
-		js = '''
-			var collection = document.getElementsByTagName("%s");
-			var attributes = %s;
-			var result = [];
-			for(var i=0; i<collection.length; i++){
-				if(collection[i].id){
-					var obj = {};
-					for(var j=0; j<attributes.length; j++){
-						var key = attributes[j];
-						obj[key] = collection[i][key];
-					}
-					result.push(obj);
-				}
-			}
-			result;'''
-		self.runJS(js % (tagName, attributes), processFunction)
+		self.searchInput = QtWidgets.QLineEdit(self)
+		self.searchInput.setPlaceholderText('Search by name...')
+		self.searchInput.setClearButtonEnabled(True)
+		self.results = QtWidgets.QListWidget(self)
+		self.reprintButton = QtWidgets.QPushButton('&Reprint', self)
+		self.reprintButton.setDefault(True)
+		closeButton = QtWidgets.QPushButton('&Close', self)
+
+		buttons = QtWidgets.QHBoxLayout()
+		buttons.addStretch()
+		buttons.addWidget(self.reprintButton)
+		buttons.addWidget(closeButton)
+
+		layout = QtWidgets.QVBoxLayout(self)
+		layout.addWidget(self.searchInput)
+		layout.addWidget(self.results)
+		layout.addLayout(buttons)
+
+		self.searchInput.textChanged.connect(self.search)
+		self.results.itemDoubleClicked.connect(self.reprint)
+		self.results.currentRowChanged.connect(self._selectionChanged)
+		self.reprintButton.clicked.connect(self.reprint)
+		closeButton.clicked.connect(self.reject)
+
+		self.search('')
+
+	def search(self, query):
+		self.results.clear()
+		for record in self.archive.search(query):
+			item = QtWidgets.QListWidgetItem(str(record), self.results)
+			item.setData(QtCore.Qt.UserRole, record)
+
+		self.results.setCurrentRow(0)
+		self._selectionChanged(self.results.currentRow())
+
+	def _selectionChanged(self, row):
+		self.reprintButton.setEnabled(row >= 0)
+
+	def reprint(self):
+		item = self.results.currentItem()
+		if item is not None:
+			self.reprintRequested.emit(item.data(QtCore.Qt.UserRole))
+
+# Rolling timings of the traced parts of the badge pipeline
+class DiagnosticsDialog(QtWidgets.QDialog):
+	COLUMNS = ['Span', 'Count', 'p50 (ms)', 'p95 (ms)', 'Max (ms)']
+
+	def __init__(self, tracer, parent=None):
+		super().__init__(parent)
+		self.tracer = tracer
+		self.setWindowTitle('Performance diagnostics')
+		self.resize(560, 360)
+
+		self.recordCheckbox = QtWidgets.QCheckBox('&Record timings', self)
+		self.recordCheckbox.setChecked(tracer.enabled)
+		self.table = QtWidgets.QTableWidget(0, len(DiagnosticsDialog.COLUMNS), self)
+		self.table.setHorizontalHeaderLabels(DiagnosticsDialog.COLUMNS)
+		self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+		self.table.verticalHeader().hide()
+		self.table.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+
+		resetButton = QtWidgets.QPushButton('R&eset', self)
+		exportButton = QtWidgets.QPushButton('&Export trace...', self)
+		closeButton = QtWidgets.QPushButton('&Close', self)
+
+		buttons = QtWidgets.QHBoxLayout()
+		buttons.addWidget(self.recordCheckbox)
+		buttons.addStretch()
+		buttons.addWidget(resetButton)
+		buttons.addWidget(exportButton)
+		buttons.addWidget(closeButton)
+
+		layout = QtWidgets.QVBoxLayout(self)
+		layout.addWidget(self.table)
+		layout.addLayout(buttons)
+
+		self.recordCheckbox.toggled.connect(tracer.enable)
+		resetButton.clicked.connect(self.reset)
+		exportButton.clicked.connect(self.export)
+		closeButton.clicked.connect(self.accept)
+
+		self.refreshTimer = QtCore.QTimer(self)
+		self.refreshTimer.setInterval(1000)
+		self.refreshTimer.timeout.connect(self.refresh)
+		self.refreshTimer.start()
+		self.refresh()
+
+	def refresh(self):
+		statistics = self.tracer.statistics()
+		self.table.setRowCount(len(statistics))
+		for row, (name, count, p50, p95, slowest) in enumerate(statistics):
+			values = [name, '%d' % count, '%.1f' % p50, '%.1f' % p95, '%.1f' % slowest]
+			for column, value in enumerate(values):
+				item = QtWidgets.QTableWidgetItem(value)
+				if column > 0:
+					item.setTextAlignment(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+				self.table.setItem(row, column, item)
+
+	def reset(self):
+		self.tracer.reset()
+		self.refresh()
+
+	def export(self):
+		result = QtWidgets.QFileDialog.getSaveFileName(
+			self, 'Export trace', 'badge-printer-trace.json', 'Chrome trace (*.json);;All files (*)'
+		)
+		if result[0] != '':
+			try:
+				self.tracer.export(result[0])
+			except OSError as exc:
+				QtWidgets.QMessageBox.warning(self, 'Export trace', 'Could not export the trace: %s' % exc)
+
+# Picks the printers that Quick Print spreads badges across
+class PrinterPoolDialog(QtWidgets.QDialog):
+	def __init__(self, printerNames, selected=(), parent=None):
+		super().__init__(parent)
+		self.setWindowTitle('Printer pool')
+
+		label = QtWidgets.QLabel('Badges go to whichever of these printers has the fewest jobs waiting:', self)
+		label.setWordWrap(True)
+		self.printers = QtWidgets.QListWidget(self)
+		for name in printerNames:
+			item = QtWidgets.QListWidgetItem(name, self.printers)
+			item.setFlags(item.flags() | QtCore.Qt.ItemIsUserCheckable)
+			item.setCheckState(QtCore.Qt.Checked if name in selected else QtCore.Qt.Unchecked)
+
+		buttons = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel, self)
+		buttons.accepted.connect(self.accept)
+		buttons.rejected.connect(self.reject)
 
+		layout = QtWidgets.QVBoxLayout(self)
+		layout.addWidget(label)
+		layout.addWidget(self.printers)
+		layout.addWidget(buttons)
 
+	def selectedPrinters(self):
+		return [
+			self.printers.item(row).text() for row in range(self.printers.count())
+			if self.printers.item(row).checkState() == QtCore.Qt.Checked
+		]
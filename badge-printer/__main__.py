@@ -1,45 +1,101 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import os, sys, traceback, io
-import shutil, tempfile
+import os, sys, traceback
 from functools import partial
-import subprocess, time
+import subprocess, threading, time
+import xml.etree.ElementTree as ET
+
+startTime = time.perf_counter()
+
+if __name__ == '__main__' and '--batch' in sys.argv:
+	# batch mode doesn't need a display, so it starts before any of the GUI is imported
+	import batch
+	sys.exit(batch.main(sys.argv))
 
 from PyQt5 import QtCore, QtGui, QtWidgets, uic
 from PyQt5 import QtWebEngineWidgets, QtPrintSupport
 from PyQt5 import QtMultimedia
 
-import pyqrcode
 import webbrowser
 
 from log import WebFormLogger
+from template import BadgeTemplate, fileFriendlyName
+from qr import makeQR, profileURL
+from printing import PrintJob, PrintQueue, PrinterPool, SpeculativeRenderThread, printerNames, printerInfos
+from renderer import RENDERERS, DEFAULT_RENDERER
+from rendercache import RenderCache
+from windowwatcher import WindowWatcher
+from templatewatcher import TemplateDirectoryWatcher
+from devices import DeviceWatcher, CameraRetirement
+from archive import BadgeArchive
+from imposition import SheetLayout, SheetCollector, impose
+from startup import StartupTimer, BackgroundCall
+from tracing import tracer
+import photo
+import assets
 import CustomWidgets
 
 CHOOSE_CUSTOM = object()
+CHOOSE_POOL = object()
 RELOAD = object()
 
 class BadgePrinterApp(QtWidgets.QApplication):
 	def __init__(self, args):
+		self.startupTimer = StartupTimer(startTime)
+		self.startupTimer.mark('imports')
 		super().__init__(args)
+		self.setOrganizationName('MakeICT')
+		self.setApplicationName('Badge Printer')
 
 		self.basePath = os.path.dirname(os.path.realpath(__file__))
 		self.templateFilename = None
+		self.template = None
 		self.cameraInfo = None
 		self.camera = None
 		self.templateElements = []
 		self.nameInputs = []
 		self.lastImage = None
+		self.pendingCapture = None
+		self.preparedPhoto = None
+		self.imageCapture = None
+		self.backgroundCalls = []
+		self.quickPrintStarted = None
+		self.previousPrinterIndex = 0
+		# pooled printers that have been unplugged, to put back in the pool when they return
+		self.poolPrintersAway = set()
+		self.benchmarkStartup = '--startup-benchmark' in args
+		tracer.enable('--trace' in args)
+
+		# what changed since the preview was last updated
+		self.dirtyFields = {}
+		self.dirtyImages = set()
+		self.previewNeedsReload = True
 
 		# Switch cameras causes a crash when the old camera object is garbage collected
-		# This list keeps all cameras in memory
-		self.cameraCollection = []
+		# while it's still shutting down, so old cameras are kept until they've unloaded
+		self.retiredCameras = CameraRetirement(self)
+		self.cameraActions = {}
+		self.cameraActionGroup = None
+		self.cameraSeparator = None
 
 		self.qrTimer = QtCore.QTimer()
 		self.qrTimer.setSingleShot(True)
 		self.qrTimer.setInterval(500)
 		self.qrTimer.timeout.connect(self.updateQRDisplay)
 
+		# coalesces bursts of field and image changes into a single preview update
+		self.previewTimer = QtCore.QTimer()
+		self.previewTimer.setSingleShot(True)
+		self.previewTimer.setInterval(30)
+		self.previewTimer.timeout.connect(self._refreshPreview)
+
+		# once the form has been left alone this long, the badge gets rendered ahead of Enter
+		self.prerenderTimer = QtCore.QTimer()
+		self.prerenderTimer.setSingleShot(True)
+		self.prerenderTimer.setInterval(750)
+		self.prerenderTimer.timeout.connect(self._prerender)
+
 		self.mainWindow = uic.loadUi(self._path('MainWindow.ui'))
 		self.mainWindow.previewTabs.tabBar().hide()
 		
@@ -55,6 +111,12 @@ class BadgePrinterApp(QtWidgets.QApplication):
 		self.mainWindow.actionImportImage.triggered.connect(self.browseForImage)
 		self.mainWindow.actionAbout.triggered.connect(self.showAppInfo)
 		self.mainWindow.actionQuickPrintHelp.triggered.connect(self.showQuickPrintHelp)
+		self.mainWindow.actionReprint.triggered.connect(self.showArchive)
+		self.mainWindow.actionDiagnostics.triggered.connect(self.showDiagnostics)
+		self.assetStore = assets.AssetStore(os.path.join('archive', 'assets'))
+		self.badgeArchive = BadgeArchive('archive')
+
+		self.mainWindow.actionCenterOnFace.toggled.connect(self._reapplyLastImage)
 
 		self.mainWindow.actionExit.triggered.connect(self.exit)
 		self.mainWindow.testQR.clicked.connect(self.testQR)
@@ -64,12 +126,10 @@ class BadgePrinterApp(QtWidgets.QApplication):
 		self.mainWindow.templateSelector.currentIndexChanged.connect(self._templateSelected)
 		self.mainWindow.quickPrintSelector.currentIndexChanged.connect(self._quickPrintSelectorChanged)
 
-		self.mainWindow.preview.documentReady.connect(self._templateLoadComplete)
+		def qrInputChanged(qrInputText):
+			self.qrTimer.start()
 
-		def updatePreviewWithoutQR(qrInputText):
-			self._updatePreview(False)
-
-		self.mainWindow.qrInput.textChanged.connect(updatePreviewWithoutQR)
+		self.mainWindow.qrInput.textChanged.connect(qrInputChanged)
 
 		if '--disable-log' in args:
 			self.entryLogger = None
@@ -89,20 +149,133 @@ class BadgePrinterApp(QtWidgets.QApplication):
 			)
 			self.entryLogger.logComplete.connect(self._entryLoggingComplete)
 			self.entryLogger.fallbackError.connect(self._entryLogFallbackError)
-
+			self.aboutToQuit.connect(self.entryLogger.shutdown)
+
+		printWorkers = 1
+		if '--print-workers' in args:
+			printWorkers = int(args[1+args.index('--print-workers')])
+
+		self.renderer = DEFAULT_RENDERER
+		if '--renderer' in args:
+			self.renderer = args[1+args.index('--renderer')]
+			if self.renderer not in RENDERERS:
+				raise ValueError('Unknown renderer "%s". Choose from: %s' % (self.renderer, ', '.join(sorted(RENDERERS))))
+		self._populateRendererMenu()
+
+		self.renderCache = None
+		renderCacheSize = 256
+		if '--render-cache-size' in args:
+			renderCacheSize = int(args[1+args.index('--render-cache-size')])
+		if renderCacheSize > 0:
+			self.renderCache = RenderCache(os.path.join('archive', 'render-cache'), renderCacheSize * 1024 * 1024)
+
+		self.printQueue = PrintQueue(printWorkers, self.renderer, self.renderCache, parent=self)
+		self.printQueue.jobQueued.connect(self._printJobQueued)
+		self.printQueue.jobProgress.connect(self._printJobProgress)
+		self.printQueue.jobFinished.connect(self._printJobFinished)
+
+		# with --sheet, Quick Print badges are saved up and printed several to a page
+		self.sheetCollector = None
+		sheetLayout = SheetLayout.fromArgs(args)
+		if sheetLayout is not None:
+			sheetTimeout = 30.0
+			if '--sheet-timeout' in args:
+				sheetTimeout = float(args[1+args.index('--sheet-timeout')])
+			self.sheetCollector = SheetCollector(sheetLayout, sheetTimeout, self)
+			self.sheetCollector.sheetReady.connect(self._sheetReady)
+			# a partly filled sheet still gets printed on the way out
+			self.aboutToQuit.connect(self.sheetCollector.flush)
+		self.aboutToQuit.connect(self.printQueue.shutdown)
+
+		# pre-rendering keeps its result in the render cache, so it needs one
+		self.speculativeRenderer = None
+		if '--prerender-delay' in args:
+			self.prerenderTimer.setInterval(int(args[1+args.index('--prerender-delay')]))
+		if self.renderCache is not None and self.sheetCollector is None and self.prerenderTimer.interval() > 0:
+			self.speculativeRenderer = SpeculativeRenderThread(self.renderCache, self)
+			self.speculativeRenderer.start()
+			self.aboutToQuit.connect(self.speculativeRenderer.shutdown)
+
+		self.templateWatcher = TemplateDirectoryWatcher('templates', self)
+		self.templateWatcher.templateAdded.connect(self._templateFileAdded)
+		self.templateWatcher.templateRemoved.connect(self._templateFileRemoved)
+		self.templateWatcher.templateChanged.connect(self._templateFileChanged)
+
+		devicePollInterval = 15.0
+		if '--device-poll-interval' in args:
+			devicePollInterval = float(args[1+args.index('--device-poll-interval')])
+		self.deviceWatcher = DeviceWatcher(devicePollInterval, self)
+		self.deviceWatcher.cameraAdded.connect(self._cameraAdded)
+		self.deviceWatcher.cameraRemoved.connect(self._cameraRemoved)
+		self.deviceWatcher.printerAdded.connect(self._printerAdded)
+		self.deviceWatcher.printerRemoved.connect(self._printerRemoved)
+		self.aboutToQuit.connect(self.deviceWatcher.stop)
+
+		self.mainWindow.preview.documentReady.connect(self._previewReady)
+		self.aboutToQuit.connect(self._waitForBackgroundCalls)
+
+		self.fitText = '--no-text-fit' not in args
+
+		# without --template, start with whatever was used last time
 		if '--template' in args:
 			self.defaultTemplate = args[1+args.index('--template')]
 		else:
-			self.defaultTemplate = None
+			self.defaultTemplate = QtCore.QSettings().value('lastTemplate')
+
+		self.startupTimer.mark('window built')
 
 	def doItNowDoItGood(self):
+		# the preview starts loading the template while everything else gets going
 		self.refreshTemplates()
-		self.refreshCameras()
 		self.refreshPrinters()
+		self._inBackground(photo.faceDetectionAvailable, self._faceDetectionChecked)
 
 		self.mainWindow.showNormal()
+		QtCore.QTimer.singleShot(0, self._windowShown)
+		if self.benchmarkStartup:
+			QtCore.QTimer.singleShot(60000, self._finishStartupBenchmark)
 		self.exec_()
 
+	def _windowShown(self):
+		self.startupTimer.mark('window shown')
+		# cameras are enumerated once the window is up, so it never waits on them
+		self.refreshCameras()
+		self._startupPhaseDone('cameras')
+		if self.deviceWatcher.pollTimer.interval() > 0:
+			self.deviceWatcher.start()
+
+	def _previewReady(self, ok):
+		self._startupPhaseDone('preview')
+
+	def _startupPhaseDone(self, phase):
+		self.startupTimer.mark(phase)
+		if self.benchmarkStartup and all(phase in self.startupTimer for phase in ('window shown', 'preview', 'cameras', 'printers')):
+			self._finishStartupBenchmark()
+
+	def _finishStartupBenchmark(self):
+		print(self.startupTimer.report())
+		self.quit()
+
+	def _inBackground(self, function, callback):
+		call = BackgroundCall(function)
+		call.done.connect(callback)
+		call.failed.connect(self._backgroundCallFailed)
+		call.finished.connect(partial(self.backgroundCalls.remove, call))
+		self.backgroundCalls.append(call)
+		call.start()
+
+	def _backgroundCallFailed(self, exc):
+		print('Background task failed: %s' % exc)
+
+	def _waitForBackgroundCalls(self):
+		for call in list(self.backgroundCalls):
+			call.wait()
+
+	def _faceDetectionChecked(self, available):
+		if not available:
+			self.mainWindow.actionCenterOnFace.setEnabled(False)
+			self.mainWindow.actionCenterOnFace.setToolTip('Face detection needs OpenCV 4 (opencv-python)')
+
 	def showAppInfo(self):
 		QtWidgets.QMessageBox.about(
 			self.mainWindow,
@@ -129,6 +302,9 @@ class BadgePrinterApp(QtWidgets.QApplication):
 		return os.path.join(self.basePath, *paths)
 
 	def _templateSelected(self, index):
+		if index < 0:
+			return
+
 		combobox = self.mainWindow.templateSelector
 		data = combobox.itemData(combobox.currentIndex())
 
@@ -147,7 +323,8 @@ class BadgePrinterApp(QtWidgets.QApplication):
 	def testQR(self):
 		webbrowser.open(self.mainWindow.qrInput.text())
 	
-	def saveACopy(self, filename=False, callback=None):
+	@tracer.traced('saveACopy')
+	def saveACopy(self, filename=False, callback=None, linkImages=False):
 		if not isinstance(filename, str):
 			result = QtWidgets.QFileDialog.getSaveFileName(
 				self.mainWindow,
@@ -162,40 +339,36 @@ class BadgePrinterApp(QtWidgets.QApplication):
 			if filename[-4:].lower() != '.svg':
 				filename += '.svg'
 
-		def doSave(filename, content):
-			with open(filename, 'w') as saveFile:
-				saveFile.write(content)
-				saveFile.flush()
-				
-			if callback is not None:
-				callback(filename)
+		with open(filename, 'w', encoding='utf-8') as saveFile:
+			if linkImages:
+				saveFile.write(self.template.toString(self.assetStore, os.path.dirname(filename)))
+			else:
+				saveFile.write(self.template.toString())
+			saveFile.flush()
 
-		self.mainWindow.preview.processContent(partial(doSave, filename))
+		if callback is not None:
+			callback(filename)
 
 	def captureToggle(self):
 		tabs = self.mainWindow.previewTabs
 		if tabs.currentWidget() != self.mainWindow.cameraTab:
-			tabs.setCurrentWidget(self.mainWindow.waitTab)
-
 			try:
 				if self.camera is None:
 					if self.cameraInfo is None:
 						self._showError('No camera selected!')
-						tabs.setCurrentWidget(self.mainWindow.badgePreviewTab)
 						return
 
-					self.camera = QtMultimedia.QCamera(self.cameraInfo)
-					self.camera.viewfinderSettings().setResolution(640,480)
-					self.camera.setViewfinder(self.mainWindow.cameraViewFinder)
-
-					def statusChanged(status):
-						if status == QtMultimedia.QCamera.ActiveStatus:
-							tabs.setCurrentWidget(self.mainWindow.cameraTab)
- 
-					self.camera.statusChanged.connect(statusChanged)
-				
-				QtCore.QTimer.singleShot(1, self.camera.start)
-				
+					tabs.setCurrentWidget(self.mainWindow.waitTab)
+					self._startCamera()
+
+				elif self.camera.status() == QtMultimedia.QCamera.ActiveStatus:
+					# the camera is kept running between pictures, so it's ready right away
+					tabs.setCurrentWidget(self.mainWindow.cameraTab)
+
+				else:
+					tabs.setCurrentWidget(self.mainWindow.waitTab)
+					QtCore.QTimer.singleShot(1, self.camera.start)
+
 			except Exception as exc:
 				print(exc)
 				self._showError('Failed to initialize camera. :(')
@@ -203,14 +376,55 @@ class BadgePrinterApp(QtWidgets.QApplication):
 				return
 
 		elif tabs.currentWidget() == self.mainWindow.cameraTab:
-			def imageSaved(id, filename):
-				self.useImage(filename)
+			if self.imageCapture.captureDestination() == QtMultimedia.QCameraImageCapture.CaptureToBuffer:
+				self.imageCapture.capture()
+			else:
+				self.imageCapture.capture(os.path.abspath(os.path.join('archive', '_capture.jpg')))
+
+	def _startCamera(self):
+		self.camera = QtMultimedia.QCamera(self.cameraInfo)
+		self.camera.viewfinderSettings().setResolution(640,480)
+		self.camera.setViewfinder(self.mainWindow.cameraViewFinder)
+		self.camera.setCaptureMode(QtMultimedia.QCamera.CaptureStillImage)
+		self.camera.statusChanged.connect(self._cameraStatusChanged)
+
+		# one capture object for the life of the camera, capturing straight into memory when possible
+		self.imageCapture = QtMultimedia.QCameraImageCapture(self.camera)
+		if self.imageCapture.isCaptureDestinationSupported(QtMultimedia.QCameraImageCapture.CaptureToBuffer):
+			self.imageCapture.setCaptureDestination(QtMultimedia.QCameraImageCapture.CaptureToBuffer)
+			if QtMultimedia.QVideoFrame.Format_Jpeg in self.imageCapture.supportedBufferFormats():
+				self.imageCapture.setBufferFormat(QtMultimedia.QVideoFrame.Format_Jpeg)
+			self.imageCapture.imageAvailable.connect(self._frameCaptured)
+		else:
+			self.imageCapture.imageSaved.connect(self._imageSaved)
+
+		QtCore.QTimer.singleShot(1, self.camera.start)
 
-			self.imageCapture = QtMultimedia.QCameraImageCapture(self.camera)
-			self.imageCapture.imageSaved.connect(imageSaved)
-			tmpFile = os.path.abspath(os.path.join('archive', '_capture.jpg'))
-			self.imageCapture.capture(tmpFile)
-			self.camera.stop()
+	def _cameraStatusChanged(self, status):
+		tabs = self.mainWindow.previewTabs
+		if status == QtMultimedia.QCamera.ActiveStatus and tabs.currentWidget() == self.mainWindow.waitTab:
+			tabs.setCurrentWidget(self.mainWindow.cameraTab)
+
+	def _frameCaptured(self, id, frame):
+		if frame.pixelFormat() == QtMultimedia.QVideoFrame.Format_Jpeg:
+			frame.map(QtMultimedia.QAbstractVideoBuffer.ReadOnly)
+			data = frame.bits().asstring(frame.mappedBytes())
+			frame.unmap()
+		else:
+			image = frame.image()
+			buffer = QtCore.QBuffer()
+			buffer.open(QtCore.QIODevice.WriteOnly)
+			image.save(buffer, 'JPG', 90)
+			data = bytes(buffer.data())
+
+		self.pendingCapture = data
+		self.useImageData(data, 'jpeg')
+
+	def _imageSaved(self, id, filename):
+		with open(filename, 'rb') as captureFile:
+			self.pendingCapture = captureFile.read()
+		os.remove(filename)
+		self.useImageData(self.pendingCapture, 'jpeg')
 
 	def browseForImage(self):
 		result = QtWidgets.QFileDialog.getOpenFileName(self.mainWindow, 'Open file', '.', 'JPEG images (*.jpg);;All files (*)')
@@ -218,49 +432,92 @@ class BadgePrinterApp(QtWidgets.QApplication):
 			self.useImage(result[0])
 
 	def useImage(self, filename):
-		self.lastImage = filename
-		with open(filename, 'rb') as captureFile:
-			self.mainWindow.preview.setImage('photo', captureFile.read(), 'jpeg')
+		with open(filename, 'rb') as imageFile:
+			self.useImageData(imageFile.read(), photo.imageTypeForFilename(filename))
+
+	def useImageData(self, data, imageType):
+		self.lastImage = (data, imageType)
+		if self.template is not None:
+			if self.template.hasElement('photo'):
+				data, imageType = self._preparePhoto(data, imageType)
+			self.template.setImage('photo', data, imageType)
+			self.dirtyImages.add('photo')
+			self._schedulePreview()
 
 		self.mainWindow.previewTabs.setCurrentWidget(self.mainWindow.badgePreviewTab)
 
+	# crops and downsamples the photo for the current template's photo box
+	def _preparePhoto(self, data, imageType):
+		settings = (self.template.elementSize('photo'), self.mainWindow.actionCenterOnFace.isChecked())
+		if settings[0] is None:
+			# without a box there's nothing to crop to, so the photo goes in as it is
+			return data, imageType
+		if self.preparedPhoto is not None and self.preparedPhoto[0] is data and self.preparedPhoto[1] == settings:
+			return self.preparedPhoto[2]
+
+		result = photo.preparePhoto(data, imageType, settings[0], centerOnFace=settings[1])
+		self.preparedPhoto = (data, settings, result)
+		return result
+
+	def _reapplyLastImage(self):
+		if self.lastImage is not None and self.template is not None:
+			self.useImageData(*self.lastImage)
+
 	def _launchInkscapeToPrint(self, filename):
 		try:
 			printProcess = subprocess.Popen(['inkscape','--verb','FilePrint','--verb','FileQuit',filename])
 		except Exception as exc:
 			return False
 		
-		# try to hide the Inkscape window
-		try:
-			# wait for Print Dialog
-			windowID = ''
-			while windowID == '':
-				windowID = subprocess.getoutput("wmctrl -pl | grep \"%s.*Print\" | sort | cut -d \" \" -f 1" % printProcess.pid)
-				time.sleep(0.01)
-
-			# get windowID of Inkscape window
-			windowID = subprocess.getoutput("wmctrl -pl | grep \"%s.*Inkscape\" | sort | cut -d \" \" -f 1" % printProcess.pid)
-			# hide the window
-			subprocess.Popen(['xdotool','windowunmap',windowID])
-		except:
-			pass # no big deal.
+		# try to hide the Inkscape window once its print dialog is up, without blocking the GUI
+		threading.Thread(target=self._hideInkscapeWindow, args=(printProcess.pid,), daemon=True).start()
 
 		return True
-		
-	def _fileIsReadyToPrint(self, printer, filename):
+
+	def _hideInkscapeWindow(self, pid):
+		watcher = WindowWatcher()
+		try:
+			if watcher.waitForWindow(pid, 'Print', timeout=30) is None:
+				return
+
+			windowID = watcher.findWindow(pid, 'Inkscape')
+			if windowID is not None:
+				watcher.hideWindow(windowID)
+		except Exception as exc:
+			print('Could not hide the Inkscape window: %s' % exc) # no big deal.
+		finally:
+			watcher.close()
+
+	def _fileIsReadyToPrint(self, printer, filename, archiveID=None):
 		inkscapeFailed = False
-		if printer is not None and isinstance(printer, QtPrintSupport.QPrinterInfo):
-			# quick print!
-			self.mainWindow.statusBar().showMessage('Quick print > render...')
-			psFilename = tempfile.mkstemp('.ps')[1]
-			process = subprocess.Popen(['inkscape','-P',psFilename,filename])
-			process.wait()
-
-			self.mainWindow.statusBar().showMessage('Quick print > print...')
-			process = subprocess.Popen(['lpr','-P',printer.printerName(),psFilename])
-			process.wait()
-			os.unlink(psFilename)
-			self.mainWindow.statusBar().showMessage('Quick print done!')
+		if printer is not None and isinstance(printer, (QtPrintSupport.QPrinterInfo, PrinterPool)):
+			# quick print! rendering and spooling happen in the background
+			# the renderer gets a single self-contained file, even if the saved badge links its images
+			try:
+				with tracer.span('pack'), open(filename, 'rb') as badgeFile:
+					content = assets.pack(badgeFile.read(), os.path.dirname(filename))
+			except OSError as exc:
+				self.quickPrintStarted = None
+				self._showError('Could not print %s: %s' % (os.path.basename(filename), exc))
+				return
+			if self.sheetCollector is not None:
+				self.quickPrintStarted = None
+				self.sheetCollector.add(printer, os.path.basename(filename), content)
+				if len(self.sheetCollector) > 0:
+					self.mainWindow.statusBar().showMessage('%d of %d badges on the next sheet' % (
+						len(self.sheetCollector), self.sheetCollector.layout.capacity
+					))
+			else:
+				job = self._printJob(printer, os.path.basename(filename), content, self.renderer)
+				job.archiveID = archiveID
+				job.layers = self._templateLayers()
+				if self.speculativeRenderer is not None:
+					self.speculativeRenderer.claim(self.renderCache.key(content, self.renderer))
+				if self.quickPrintStarted is not None:
+					# the job's time starts when Enter was pressed
+					job.started = self.quickPrintStarted
+					self.quickPrintStarted = None
+				self.printQueue.submit(job)
 
 		elif self.mainWindow.actionUseInkscape.isChecked():
 			self.mainWindow.statusBar().showMessage('Printing via Inkscape...', 5000)
@@ -283,8 +540,14 @@ class BadgePrinterApp(QtWidgets.QApplication):
 				else:
 					self.mainWindow.statusBar().showMessage('Printing failed :(')
 					
+			# make sure the page being printed reflects the latest template state
+			def previewReady(ok):
+				self.mainWindow.preview.loadFinished.disconnect(previewReady)
+				self.mainWindow.preview.page().print(self.printer, printingDone)
+
 			self.mainWindow.statusBar().showMessage('Printing...')
-			self.mainWindow.preview.page().print(self.printer, printingDone)
+			self.mainWindow.preview.loadFinished.connect(previewReady)
+			self._refreshPreview(True)
 		
 		self.addLogEntry()
 		
@@ -292,17 +555,126 @@ class BadgePrinterApp(QtWidgets.QApplication):
 			self.templateElements[0].setFocus()
 			self.templateElements[0].selectAll()
 
+	def _populateRendererMenu(self):
+		rendererActionGroup = QtWidgets.QActionGroup(self)
+		for name in sorted(RENDERERS):
+			action = QtWidgets.QAction(RENDERERS[name].description, self.mainWindow.menuRenderer)
+			action.setCheckable(True)
+			action.setChecked(name == self.renderer)
+			action.triggered.connect(partial(self.setRenderer, name))
+			self.mainWindow.menuRenderer.addAction(action)
+			rendererActionGroup.addAction(action)
+
+	def setRenderer(self, name):
+		self.renderer = name
+
+	def _printJobQueued(self, job):
+		self.mainWindow.statusBar().showMessage('Quick print %s > queued (%d pending)' % (job, self.printQueue.pending()))
+
+	def _printJobProgress(self, job, step):
+		self.mainWindow.statusBar().showMessage('Quick print %s > %s...' % (job, step))
+
+	# the template's artwork is only parsed once by renderers that can paint the badge in layers
+	def _templateLayers(self):
+		if not RENDERERS[self.renderer].usesLayers:
+			return None
+
+		with tracer.span('layers'):
+			return self.template.layers()
+
+	# printer is either a single QPrinterInfo or a PrinterPool that picks one when the job is spooled
+	def _printJob(self, printer, name, content, renderer, spool=None):
+		if isinstance(printer, PrinterPool):
+			return PrintJob(name, content, None, renderer, spool=spool, pool=printer)
+
+		return PrintJob(name, content, printer.printerName(), renderer, spool=spool)
+
+	# the sheet is laid out by the print worker, so a full sheet doesn't hold up the next badge
+	def _sheetReady(self, printer, badges):
+		names = [name for name, content in badges]
+		contents = [content for name, content in badges]
+		job = self._printJob(printer, 'sheet of %d (%s)' % (len(badges), ', '.join(names)), None, self.renderer)
+		job.prepare = partial(impose, contents, self.sheetCollector.layout)
+		self.printQueue.submit(job)
+
+	def _printJobFinished(self, job, ok, error):
+		tracer.record('badge', job.started, time.perf_counter(), {'ok': ok, 'cached': job.cached}, id=job.id)
+		if ok:
+			where = ' on %s' % job.printerName if job.pool is not None else ''
+			self.mainWindow.statusBar().showMessage('Quick print %s done%s!%s' % (job, where, ' (already rendered)' if job.cached else ''), 5000)
+			if job.archiveID is not None:
+				# keep what was sent to the printer, so a reprint doesn't have to render again
+				try:
+					self.badgeArchive.setSpool(job.archiveID, job.renderer, job.spool)
+				except Exception as exc:
+					print('Failed to archive print output for %s: %s' % (job, exc))
+		else:
+			self.mainWindow.statusBar().showMessage('Quick print %s failed :( %s' % (job, error))
+
+	@tracer.traced('attemptPrint')
 	def attemptPrint(self, printer=None):
 		name = self.makeFileFriendlyName()
-		filename = os.path.join('archive', 'badges', '%s.svg' % name)
-		self.saveACopy(filename, partial(self._fileIsReadyToPrint, printer))
-		if os.path.isfile(os.path.join('archive', '_capture.jpg')):
-			shutil.move(
-				os.path.join('archive', '_capture.jpg'),
-				os.path.join('archive', 'captures', '%s.jpg' % name)
-			)
+		filename = self.badgeArchive.uniqueFilename('badges', name, 'svg')
+		linkImages = self.mainWindow.actionLinkImages.isChecked()
+		capture = None
+		if self.pendingCapture is not None:
+			# archiving the capture doesn't need to hold up the next badge
+			capture = (self.badgeArchive.uniqueFilename('captures', name, 'jpg'), self.pendingCapture)
+			if linkImages:
+				target, args = self.assetStore.link, (self.pendingCapture, 'jpeg', capture[0])
+			else:
+				target, args = writeFile, capture
+			threading.Thread(target=target, args=args).start()
+			self.pendingCapture = None
+		self.saveACopy(filename, partial(self._badgeSaved, printer, name, capture), linkImages)
 		self.mainWindow.statusBar().showMessage('Images saved!')
 
+	def _badgeSaved(self, printer, name, capture, filename):
+		captureFilename, captureData = capture if capture is not None else (None, None)
+		fields = dict((widget.fieldID, widget.text()) for widget in self.templateElements)
+		try:
+			with tracer.span('archive'):
+				archiveID = self.badgeArchive.add(name, self.templateFilename, fields, filename, captureFilename, captureData)
+		except Exception as exc:
+			# a broken index shouldn't stop the badge from printing
+			print('Failed to index %s: %s' % (filename, exc))
+			archiveID = None
+
+		self._fileIsReadyToPrint(printer, filename, archiveID)
+
+	def showDiagnostics(self):
+		dialog = CustomWidgets.DiagnosticsDialog(tracer, self.mainWindow)
+		dialog.exec_()
+
+	def showArchive(self):
+		dialog = CustomWidgets.ArchiveSearchDialog(self.badgeArchive, self.mainWindow)
+		dialog.reprintRequested.connect(self.reprint)
+		dialog.exec_()
+
+	# sends an archived badge to the Quick Print printer without capturing or rendering it again
+	def reprint(self, record):
+		printer = self.mainWindow.quickPrintSelector.currentData()
+		if not isinstance(printer, (QtPrintSupport.QPrinterInfo, PrinterPool)):
+			self._showError('Select a Quick Print printer to reprint badges.')
+			return
+
+		name = os.path.basename(record.badgeFile)
+		try:
+			if record.spoolFile is not None and os.path.isfile(record.spoolFile):
+				with open(record.spoolFile, 'rb') as spoolFile:
+					job = self._printJob(printer, name, None, record.spoolRenderer, spool=spoolFile.read())
+			else:
+				# badges printed before spool files were kept get rendered once, then kept too
+				with open(record.badgeFile, 'rb') as badgeFile:
+					content = assets.pack(badgeFile.read(), os.path.dirname(record.badgeFile))
+				job = self._printJob(printer, name, content, self.renderer)
+				job.archiveID = record.id
+		except OSError as exc:
+			self._showError('Could not reprint %s: %s' % (record, exc))
+			return
+
+		self.printQueue.submit(job)
+
 	def _entryLoggingComplete(self, ok, error):
 		if ok:
 			self.mainWindow.statusBar().showMessage('Logging done!', 5000)
@@ -321,23 +693,12 @@ class BadgePrinterApp(QtWidgets.QApplication):
 		self.mainWindow.statusBar().showMessage('Logging entry...')
 		data = {}
 		for w in self.templateElements:
-			fieldID = self.mainWindow.formLayout.labelForField(w).text()
-			fieldValue = w.text()
-			data[fieldID] = fieldValue
+			data[w.fieldID] = w.text()
 
 		self.entryLogger.logEntry(data)
 
 	def makeFileFriendlyName(self, replaceBlankWithAnonymous=True):
-		names = []
-		for w in self.nameInputs:
-			if w.text() != '':
-				names.append(w.text().replace(' ', '_'))
-
-		name = '_'.join(names)
-		if replaceBlankWithAnonymous and name == '':
-			name = 'Anonymous_McNameface'
-
-		return name
+		return fileFriendlyName([w.text() for w in self.nameInputs], replaceBlankWithAnonymous)
 
 	def exit(self):
 		# @TODO: maybe check if changes made since last print or save
@@ -352,13 +713,16 @@ class BadgePrinterApp(QtWidgets.QApplication):
 				if filename[-4:].lower() == '.svg':
 					templates.append(filename)
 			templates.sort()
-			combobox.addItems(templates)
 
+			# filling the list would load every template it passes through, so only the chosen one is loaded
+			combobox.blockSignals(True)
+			combobox.addItems(templates)
 			if self.defaultTemplate is not None:
 				index = combobox.findText(self.defaultTemplate)
 				if index > -1:
 					combobox.setCurrentIndex(index)
-					
+			combobox.blockSignals(False)
+
 			self.loadTemplate(combobox.currentText())
 		except:
 			self._showError('Failed to load templates from %s' % os.path.abspath('templates'))
@@ -367,137 +731,296 @@ class BadgePrinterApp(QtWidgets.QApplication):
 		combobox.addItem('✎ Choose custom...', CHOOSE_CUSTOM)
 		combobox.addItem('⟳ Refresh templates', RELOAD)
 
+	def _templateItemCount(self):
+		combobox = self.mainWindow.templateSelector
+		for index in range(combobox.count()):
+			if combobox.itemData(index, QtCore.Qt.AccessibleDescriptionRole) == 'separator':
+				return index
+
+		return combobox.count()
+
+	def _templateFileAdded(self, filename):
+		combobox = self.mainWindow.templateSelector
+		count = self._templateItemCount()
+		if combobox.findText(filename) in range(count):
+			return
+
+		index = 0
+		while index < count and combobox.itemText(index) < filename:
+			index += 1
+
+		combobox.blockSignals(True)
+		combobox.insertItem(index, filename)
+		combobox.blockSignals(False)
+		self.mainWindow.statusBar().showMessage('Template added: %s' % filename, 5000)
+
+	def _templateFileRemoved(self, filename):
+		combobox = self.mainWindow.templateSelector
+		index = combobox.findText(filename)
+		if index not in range(self._templateItemCount()):
+			return
+
+		# the combobox would move on to whatever is next, which might be the separator
+		wasCurrent = index == combobox.currentIndex()
+		combobox.blockSignals(True)
+		combobox.removeItem(index)
+		if wasCurrent:
+			# with no templates left, the one that was loaded stays until another is chosen
+			count = self._templateItemCount()
+			combobox.setCurrentIndex(min(index, count - 1))
+		combobox.blockSignals(False)
+		self.mainWindow.statusBar().showMessage('Template removed: %s' % filename, 5000)
+		if wasCurrent and combobox.currentIndex() >= 0:
+			self.loadTemplate(combobox.currentText())
+
+	def _templateFileChanged(self, filename):
+		if self.templateFilename == os.path.join('templates', filename):
+			# form widgets are reused, so whatever has been typed survives the reload
+			if self.loadTemplate(filename):
+				self.mainWindow.statusBar().showMessage('Template reloaded: %s' % filename, 5000)
+
+	# A template that can't be read (say, one that's only half saved) leaves the current one
+	# in place, and returns False
 	def loadTemplate(self, filename):
+		path = os.path.join('templates', filename)
+		try:
+			template = BadgeTemplate(path, self.fitText)
+		except (ET.ParseError, OSError, ValueError) as exc:
+			self.mainWindow.statusBar().showMessage('Could not load template %s: %s' % (filename, exc), 10000)
+			return False
+
 		self.mainWindow.preview.hide()
 
-		filename = os.path.join('templates', filename)
-		self.templateFilename = filename
-
-		self.mainWindow.preview.setUrl(QtCore.QUrl.fromLocalFile(os.path.abspath(filename)))
-
-	# this runs whenever the SVG preview is loaded (including blank loads)
-	def _templateLoadComplete(self, content):
-		def addElements(elements):
-			# Remove boring, old, template-specific widgets from the form
-			rememberedValues = {}
-			for rowID in range(self.mainWindow.formLayout.rowCount()-1, 3, -1):
-				layoutItem = self.mainWindow.formLayout.itemAt(
-					rowID,
-					QtWidgets.QFormLayout.FieldRole
-				)
-				if layoutItem is not None:
-					widget = layoutItem.widget()
-					if widget in self.templateElements:
-						label = self.mainWindow.formLayout.labelForField(widget)
-						rememberedValues[label.text().replace('&', '')] = widget.text()
-						label.deleteLater()
-						widget.deleteLater()
-		
-			self.nameInputs = []
+		QtCore.QSettings().setValue('lastTemplate', filename)
+
+		self.templateFilename = path
+		self.template = template
 
-			# add new and exciting template-specific widgets to the form
-			self.templateElements = []
+		self._buildForm(self.template.fields())
+		# reused widgets keep what was typed, so the new template starts out with it
+		for widget in self.templateElements:
+			self.template.setText(widget.fieldID, widget.text())
+
+		self.previewNeedsReload = True
+		self.updateQRDisplay()
+		if self.lastImage is not None:
+			self.useImageData(*self.lastImage)
+		self._refreshPreview()
+		self.mainWindow.preview.show()
+		return True
+
+	def _buildForm(self, elements):
+		# Take the old template-specific rows out of the form, keeping their widgets for reuse
+		oldWidgets = {}
+		for widget in self.templateElements:
+			row = self.mainWindow.formLayout.takeRow(widget)
+			oldWidgets[widget.fieldID] = (row.labelItem.widget(), widget)
+
+		self.nameInputs = []
+		self.templateElements = []
 
-			# keep track of this to update tab order
-			lastElement = self.mainWindow.testQR
-			for element in elements:
+		# keep track of this to update tab order
+		lastElement = self.mainWindow.testQR
+		for element in elements:
+			isFirstName = element['id'].lower() == 'first name'
+			isLastName = element['id'].lower() == 'last name'
+
+			if element['id'] in oldWidgets:
+				# fields shared between templates keep their widget and value
+				label, widget = oldWidgets.pop(element['id'])
+			else:
+				label = element['id']
 				widget = CustomWidgets.LineEditSubmitter(self.mainWindow)
+				widget.fieldID = element['id']
 				widget.enterKeyPressed.connect(self.quickPrint)
+				widget.textChanged.connect(partial(self.textFieldUpdated, widget, isFirstName or isLastName))
 
-				if element['id'] in rememberedValues:
-					widget.setText(rememberedValues[element['id']])
-				elif element['id'].lower() == 'date':
+				if element['id'].lower() == 'date':
 					widget.setText(time.strftime('%Y %B %d'))
 				else:
 					widget.setText(element['textContent'])
 
-				isFirstName = element['id'].lower() == 'first name'
-				isLastName = element['id'].lower() == 'last name'
+			self.templateElements.append(widget)
+			self.mainWindow.formLayout.addRow(label, widget)
 
-				widget.textChanged.connect(partial(self.textFieldUpdated, isFirstName or isLastName))
+			if isFirstName:
+				self.nameInputs.insert(0, widget)
+			elif isLastName:
+				self.nameInputs.append(widget)
 
-				self.templateElements.append(widget)
-				self.mainWindow.formLayout.addRow(element['id'], widget)
+			QtWidgets.QWidget.setTabOrder(lastElement, widget)
+			lastElement = widget
 
-				if isFirstName:
-					self.nameInputs.insert(0, widget)
-				elif isLastName:
-					self.nameInputs.append(widget)
+		QtWidgets.QWidget.setTabOrder(lastElement, self.mainWindow.captureButton)
 
-				QtWidgets.QWidget.setTabOrder(lastElement, widget)
-				lastElement = widget
+		# Remove boring, old widgets that the new template doesn't use
+		for label, widget in oldWidgets.values():
+			label.deleteLater()
+			widget.deleteLater()
 
-			QtWidgets.QWidget.setTabOrder(lastElement, self.mainWindow.captureButton)
+	def textFieldUpdated(self, widget, isName, text):
+		if self.template is not None:
+			self.template.setText(widget.fieldID, text)
+			self.dirtyFields[widget.fieldID] = text
+			self._schedulePreview()
 
-		self.mainWindow.preview.extractTags('text', ['textContent'], addElements)
+		if isName:
+			self.mainWindow.qrInput.setText(profileURL(self.makeFileFriendlyName(False)))
 
-		self._updatePreview(False)
-		if self.lastImage is not None and os.path.isfile(self.lastImage):
-			self.useImage(self.lastImage)
-		self.mainWindow.preview.show()
+	# the timer isn't restarted by later changes, so fast typing still updates the preview as it goes
+	def _schedulePreview(self):
+		if not self.previewTimer.isActive():
+			self.previewTimer.start()
 
-	def textFieldUpdated(self, value):
-		self._updatePreview(True)
+		# whereas a pre-render is only worth starting once the typing stops
+		if self.speculativeRenderer is not None:
+			# changes that leave the badge as it was, like Quick Print's QR code update, keep the render
+			if self.speculativeRenderer.speculating():
+				self.speculativeRenderer.cancel(self.renderCache.key(self.template.toBytes(), self.renderer))
+			self.prerenderTimer.start()
 
-	def _updatePreview(self, updateQRInput):
-		self.qrTimer.stop()
-		for widget in self.templateElements:
-			id = self.mainWindow.formLayout.labelForField(widget).text().replace('&', '')
-			self.mainWindow.preview.setText(id, widget.text())
+	def _prerender(self):
+		if self.template is None or self.qrTimer.isActive():
+			return # the QR code is about to change, which starts the wait over
 
-		if updateQRInput != False:
-			name = QtCore.QUrl.toPercentEncoding(self.makeFileFriendlyName(False)).data().decode('utf-8')
-			if name == '':
-				self.mainWindow.qrInput.setText('http://makeict.org/')
+		printer = self.mainWindow.quickPrintSelector.currentData()
+		if isinstance(printer, (QtPrintSupport.QPrinterInfo, PrinterPool)):
+			# the same bytes Quick Print will pack from the saved badge, so the cache keys match
+			self.speculativeRenderer.speculate(self.template.toBytes(), self.renderer, self._templateLayers())
+
+	@tracer.traced('preview update')
+	def _refreshPreview(self, reload=False):
+		self.previewTimer.stop()
+		if self.template is None:
+			return
+
+		if reload or self.previewNeedsReload:
+			self.mainWindow.preview.setDocument(
+				self.template.toBytes(),
+				QtCore.QUrl.fromLocalFile(os.path.abspath(self.templateFilename))
+			)
+			self.previewNeedsReload = False
+		else:
+			# everything that changed goes to the page in one call
+			images = {}
+			for id in self.dirtyImages:
+				href = self.template.imageHref(id)
+				if href is not None:
+					images[id] = href
+			if self.template.fitText:
+				# fitted text may have been resized or wrapped onto more lines, so send the whole thing
+				markup = dict((id, self.template.textMarkup(id)) for id in self.dirtyFields)
+				self.mainWindow.preview.updateDocument(images=images, markup=markup)
 			else:
-				self.mainWindow.qrInput.setText('http://makeict.org/wiki/User:%s' % name)
+				self.mainWindow.preview.updateDocument(self.dirtyFields, images)
 
-		self.qrTimer.start()
+		self.dirtyFields = {}
+		self.dirtyImages = set()
 
+	@tracer.traced('updateQRDisplay')
 	def updateQRDisplay(self):
 		self.qrTimer.stop()
-		buffer = io.BytesIO()
-		qr = pyqrcode.create(self.mainWindow.qrInput.text())
-		qr.png(buffer, scale=10, quiet_zone=0)
-		self.mainWindow.preview.setImage('qr', buffer.getvalue(), 'png')
-	
+		if self.template is None:
+			return
+
+		self.template.setImage('qr', makeQR(self.mainWindow.qrInput.text()), 'png')
+		self.dirtyImages.add('qr')
+		self._schedulePreview()
+
 	def refreshCameras(self):
 		self.mainWindow.menuCameras.clear()
+		self.cameraActions = {}
+		if self.cameraActionGroup is not None:
+			self.cameraActionGroup.deleteLater()
+		self.cameraActionGroup = QtWidgets.QActionGroup(self)
+		self.cameraSeparator = None
 
 		oldCameraInfo = self.cameraInfo
 		self.cameraInfo = None
-		availableCameras = QtMultimedia.QCameraInfo.availableCameras()
+		availableCameras = self.deviceWatcher.scanCameras()
 		if len(availableCameras) == 0:
 			self._showError('No cameras available. Are you sure it\'s plugged in?')
 		else:
-			cameraActionGroup = QtWidgets.QActionGroup(self)
-
 			for cameraInfo in availableCameras:
-				action = QtWidgets.QAction(
-					'%s (%s)' % (cameraInfo.description(), cameraInfo.deviceName()),
-					self.mainWindow.menuCameras
-				)
-				action.setCheckable(True)
-				action.triggered.connect(partial(self.setCamera, cameraInfo))
+				action = self._addCameraAction(cameraInfo)
 
 				if self.cameraInfo is None:
 					if oldCameraInfo is None or oldCameraInfo.deviceName() == cameraInfo.deviceName():
 						action.setChecked(True)
 						self.cameraInfo = cameraInfo
 
-				self.mainWindow.menuCameras.addAction(action)
-				cameraActionGroup.addAction(action)
-
-		self.mainWindow.menuCameras.addSeparator()
+		self.cameraSeparator = self.mainWindow.menuCameras.addSeparator()
 		actionRefreshCameras = QtWidgets.QAction('⟳ &Refresh', self.mainWindow.menuCameras)
 		self.mainWindow.menuCameras.addAction(actionRefreshCameras)
 		actionRefreshCameras.triggered.connect(self.refreshCameras)
 
+	def _addCameraAction(self, cameraInfo):
+		action = QtWidgets.QAction(
+			'%s (%s)' % (cameraInfo.description(), cameraInfo.deviceName()),
+			self.mainWindow.menuCameras
+		)
+		action.setCheckable(True)
+		action.triggered.connect(partial(self.setCamera, cameraInfo))
+
+		# new cameras go at the end of the list, above Refresh
+		if self.cameraSeparator is None:
+			self.mainWindow.menuCameras.addAction(action)
+		else:
+			self.mainWindow.menuCameras.insertAction(self.cameraSeparator, action)
+		self.cameraActionGroup.addAction(action)
+		self.cameraActions[cameraInfo.deviceName()] = action
+
+		return action
+
+	def _cameraAdded(self, cameraInfo):
+		action = self._addCameraAction(cameraInfo)
+		if self.cameraInfo is None:
+			action.setChecked(True)
+			self.setCamera(cameraInfo)
+
+		self.mainWindow.statusBar().showMessage('Camera connected: %s' % cameraInfo.description(), 5000)
+
+	def _cameraRemoved(self, deviceName):
+		action = self.cameraActions.pop(deviceName, None)
+		if action is not None:
+			self.cameraActionGroup.removeAction(action)
+			self.mainWindow.menuCameras.removeAction(action)
+			action.deleteLater()
+
+		if self.cameraInfo is not None and self.cameraInfo.deviceName() == deviceName:
+			# carry on with whichever camera is left; one plugged in at the same time
+			# hasn't got its menu entry yet, and gets picked up when it's added
+			cameraInfo = self.deviceWatcher.firstCamera(self.cameraActions)
+			if cameraInfo is not None:
+				self.cameraActions[cameraInfo.deviceName()].setChecked(True)
+				self.setCamera(cameraInfo)
+			else:
+				self.setCamera(None)
+
+		self.mainWindow.statusBar().showMessage('Camera disconnected: %s' % deviceName, 5000)
+
 	def refreshPrinters(self):
+		# network printers can take seconds to answer, so look for them in the background
+		self.mainWindow.quickPrintSelector.blockSignals(True)
 		self.mainWindow.quickPrintSelector.clear()
+		self.mainWindow.quickPrintSelector.addItem('Looking for printers...')
+		self.mainWindow.quickPrintSelector.blockSignals(False)
 		self.mainWindow.quickPrint.setEnabled(False)
 
-		availablePrinters = QtPrintSupport.QPrinterInfo.availablePrinters()
+		self._inBackground(printerNames, self._printerNamesFound)
+
+	# the names come from lpstat in the background, the QPrinterInfos are made here
+	def _printerNamesFound(self, names):
+		self._printersFound(printerInfos(names))
+
+	def _printersFound(self, availablePrinters):
+		# adding the printers below selects one of them, which would forget that the pool was in use
+		usePrinterPool = QtCore.QSettings().value('usePrinterPool', False, type=bool)
+		self.mainWindow.quickPrintSelector.blockSignals(True)
+		self.mainWindow.quickPrintSelector.clear()
+		self.mainWindow.quickPrintSelector.blockSignals(False)
+		self._startupPhaseDone('printers')
+
 		if len(availablePrinters) == 0:
 			self._showError('No printers available. Are you sure it\'s plugged in and installed?')
 		else:
@@ -506,22 +1029,154 @@ class BadgePrinterApp(QtWidgets.QApplication):
 				if printerInfo.isDefault():
 					self.mainWindow.quickPrintSelector.setCurrentIndex(self.mainWindow.quickPrintSelector.count()-1)
 
+			if len(availablePrinters) > 1:
+				# bring back the pool from last time, minus any printers that have gone away
+				settings = QtCore.QSettings()
+				names = [printerInfo.printerName() for printerInfo in availablePrinters]
+				savedNames = settings.value('printerPool', [], type=list)
+				returned = [name for name in sorted(self.poolPrintersAway) if name in names and name not in savedNames]
+				if len(returned) > 0:
+					self.poolPrintersAway -= set(returned)
+					savedNames += returned
+					settings.setValue('printerPool', savedNames)
+				poolNames = [name for name in savedNames if name in names]
+				if len(poolNames) > 0:
+					self._setPrinterPool(PrinterPool(poolNames), select=usePrinterPool)
+				self.mainWindow.quickPrintSelector.addItem('⇄ Printer pool...', CHOOSE_POOL)
+
 			self.mainWindow.quickPrintSelector.addItem('⟳ Refresh', RELOAD)
+			self.mainWindow.statusBar().showMessage('Found %d printers' % len(availablePrinters), 5000)
+
+		self.previousPrinterIndex = self.mainWindow.quickPrintSelector.currentIndex()
+		self.deviceWatcher.setPrinters([printerInfo.printerName() for printerInfo in availablePrinters])
+
+	def _printerIndexes(self):
+		selector = self.mainWindow.quickPrintSelector
+		return [i for i in range(selector.count()) if isinstance(selector.itemData(i), QtPrintSupport.QPrinterInfo)]
+
+	def _printerAdded(self, printerInfo):
+		indexes = self._printerIndexes()
+		# going from one printer to two brings in the pool, so that's easier done from scratch
+		if len(indexes) < 2:
+			self.refreshPrinters()
+			return
+
+		selector = self.mainWindow.quickPrintSelector
+		selector.blockSignals(True)
+		selector.insertItem(indexes[-1] + 1, printerInfo.printerName(), printerInfo)
+		selector.blockSignals(False)
+		self._updatePrinterPool(printerInfo.printerName(), True)
+		self.previousPrinterIndex = selector.currentIndex()
+		self.mainWindow.statusBar().showMessage('Printer added: %s' % printerInfo.printerName(), 5000)
+
+	def _printerRemoved(self, printerName):
+		selector = self.mainWindow.quickPrintSelector
+		indexes = [i for i in self._printerIndexes() if selector.itemData(i).printerName() == printerName]
+		if len(indexes) == 0:
+			return
+		if len(self._printerIndexes()) <= 2:
+			self.refreshPrinters()
+			return
+
+		# the selector would move on to the next entry, which might be one of the actions
+		wasCurrent = indexes[0] == selector.currentIndex()
+		selector.blockSignals(True)
+		selector.removeItem(indexes[0])
+		if wasCurrent:
+			selector.setCurrentIndex(self._printerIndexes()[0])
+		selector.blockSignals(False)
+		if wasCurrent:
+			self._quickPrintSelectorChanged(selector.currentIndex())
+
+		self._updatePrinterPool(printerName, False)
+		self.previousPrinterIndex = selector.currentIndex()
+		self.mainWindow.statusBar().showMessage('Printer removed: %s' % printerName, 5000)
+
+	# takes a printer that's gone out of the pool, and puts it back when it returns
+	def _updatePrinterPool(self, printerName, present):
+		selector = self.mainWindow.quickPrintSelector
+		pool = None
+		for i in range(selector.count()):
+			if isinstance(selector.itemData(i), PrinterPool):
+				pool = selector.itemData(i)
+
+		if present:
+			if printerName not in self.poolPrintersAway:
+				return
+			self.poolPrintersAway.discard(printerName)
+			names = (pool.printerNames if pool is not None else []) + [printerName]
+		else:
+			if pool is None or printerName not in pool.printerNames:
+				return
+			self.poolPrintersAway.add(printerName)
+			names = [name for name in pool.printerNames if name != printerName]
+
+		QtCore.QSettings().setValue('printerPool', names)
+		selected = isinstance(selector.currentData(), PrinterPool)
+		self._setPrinterPool(PrinterPool(names) if len(names) > 0 else None, select=selected)
 
 	def _quickPrintSelectorChanged(self, index):
 		printer = self.mainWindow.quickPrintSelector.currentData()
 		if printer == RELOAD:
 			self.refreshPrinters()
+		elif printer == CHOOSE_POOL:
+			self.choosePrinterPool()
 		else:
 			self.mainWindow.quickPrint.setEnabled(True)
+			self.previousPrinterIndex = index
+			if isinstance(printer, (QtPrintSupport.QPrinterInfo, PrinterPool)):
+				QtCore.QSettings().setValue('usePrinterPool', isinstance(printer, PrinterPool))
+
+	def choosePrinterPool(self):
+		selector = self.mainWindow.quickPrintSelector
+		names = []
+		current = []
+		for i in range(selector.count()):
+			data = selector.itemData(i)
+			if isinstance(data, QtPrintSupport.QPrinterInfo):
+				names.append(data.printerName())
+			elif isinstance(data, PrinterPool):
+				current = data.printerNames
+
+		dialog = CustomWidgets.PrinterPoolDialog(names, current, self.mainWindow)
+		if dialog.exec_() and len(dialog.selectedPrinters()) > 0:
+			QtCore.QSettings().setValue('printerPool', dialog.selectedPrinters())
+			self.poolPrintersAway = set()
+			self._setPrinterPool(PrinterPool(dialog.selectedPrinters()), select=True)
+		else:
+			selector.setCurrentIndex(self.previousPrinterIndex)
+
+	# the pool gets its own entry, just before the printers; without a pool the entry goes
+	def _setPrinterPool(self, pool, select=False):
+		selector = self.mainWindow.quickPrintSelector
+		selector.blockSignals(True)
+		for i in range(selector.count()):
+			if isinstance(selector.itemData(i), PrinterPool):
+				selector.removeItem(i)
+				break
+		if pool is None:
+			selector.blockSignals(False)
+			if select:
+				# the selector has moved on to the first printer
+				self._quickPrintSelectorChanged(selector.currentIndex())
+			return
+		selector.insertItem(0, 'Pool: %s' % pool, pool)
+		selector.blockSignals(False)
+
+		if select:
+			selector.blockSignals(True)
+			selector.setCurrentIndex(0)
+			selector.blockSignals(False)
+			self._quickPrintSelectorChanged(0)
 
 	def quickPrint(self):
+		self.quickPrintStarted = time.perf_counter()
 		self.updateQRDisplay()
 		printer = self.mainWindow.quickPrintSelector.currentData()
 		QtCore.QTimer.singleShot(1, partial(self.attemptPrint, printer))
 
 	def cancelCapture(self):
-		self.camera.stop()
+		# the camera keeps running so the next capture starts instantly
 		self.mainWindow.previewTabs.setCurrentWidget(self.mainWindow.badgePreviewTab)
 	
 	def setCamera(self, cameraInfo):
@@ -531,9 +1186,9 @@ class BadgePrinterApp(QtWidgets.QApplication):
 			self.cancelCapture()
 
 		if self.camera is not None:
-			self.cameraCollection.append(self.camera)
-			self.camera.setViewfinder(None)
+			self.retiredCameras.retire(self.camera, self.imageCapture)
 			self.camera = None
+			self.imageCapture = None
 			self.mainWindow.cameraViewFinder.setMediaObject(None)
 
 		self.cameraInfo = cameraInfo
@@ -543,8 +1198,17 @@ class BadgePrinterApp(QtWidgets.QApplication):
 
 
 	def _showError(self, msg):
+		if self.benchmarkStartup:
+			# nobody is there to close the message box
+			print(msg)
+			return
+
 		QtWidgets.QMessageBox.warning(self.mainWindow, 'MakeICT Badge Printer', msg)
 
+def writeFile(filename, data):
+	with open(filename, 'wb') as outputFile:
+		outputFile.write(data)
+
 def handle_exception(parentWindow, excType, exc, tb):
 	if issubclass(excType, KeyboardInterrupt):
 		sys.__excepthook__(excType, exc, tb)
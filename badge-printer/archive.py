@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, re, time, json, hashlib
+import sqlite3
+
+SPOOL_EXTENSIONS = {
+	b'%!PS': 'ps',
+	b'%PDF': 'pdf',
+}
+
+def fileHash(filename):
+	digest = hashlib.sha256()
+	with open(filename, 'rb') as hashedFile:
+		for block in iter(lambda: hashedFile.read(65536), b''):
+			digest.update(block)
+	return digest.hexdigest()
+
+def searchTerms(name):
+	return sorted(set(term for term in re.split(r'[\s_]+', name.lower()) if term != ''))
+
+class BadgeRecord(object):
+	def __init__(self, row):
+		self.id, self.name, self.template, self.timestamp, fields, \
+			self.badgeFile, self.badgeHash, self.captureFile, self.captureHash, \
+			self.spoolFile, self.spoolRenderer = row
+		self.fields = json.loads(fields) if fields else {}
+
+	def __str__(self):
+		return '%s (%s, %s)' % (
+			self.name.replace('_', ' '),
+			os.path.splitext(os.path.basename(self.template or '?'))[0],
+			time.strftime('%Y-%m-%d %H:%M', time.localtime(self.timestamp))
+		)
+
+# SQLite index over everything in archive/, searchable by name prefix
+class BadgeArchive(object):
+	COLUMNS = 'id, name, template, timestamp, fields, badgeFile, badgeHash, captureFile, captureHash, spoolFile, spoolRenderer'
+
+	def __init__(self, directory='archive', filename=None):
+		self.directory = directory
+		if filename is None:
+			filename = os.path.join(directory, 'archive.sqlite3')
+
+		isNew = not os.path.isfile(filename)
+		self.db = sqlite3.connect(filename, isolation_level=None)
+		self.db.execute('PRAGMA journal_mode=WAL')
+		self.db.executescript('''
+			CREATE TABLE IF NOT EXISTS badges (
+				id INTEGER PRIMARY KEY,
+				name TEXT NOT NULL,
+				template TEXT,
+				timestamp INTEGER NOT NULL,
+				fields TEXT,
+				badgeFile TEXT,
+				badgeHash TEXT,
+				captureFile TEXT,
+				captureHash TEXT,
+				spoolFile TEXT,
+				spoolRenderer TEXT
+			);
+			CREATE TABLE IF NOT EXISTS terms (
+				term TEXT NOT NULL,
+				badge INTEGER NOT NULL REFERENCES badges(id) ON DELETE CASCADE
+			);
+			CREATE INDEX IF NOT EXISTS termsByTerm ON terms (term, badge);
+			CREATE INDEX IF NOT EXISTS badgesByTimestamp ON badges (timestamp);
+			CREATE INDEX IF NOT EXISTS badgesByBadgeHash ON badges (badgeHash);
+		''')
+
+		if isNew:
+			self.importExisting()
+
+	def close(self):
+		self.db.close()
+
+	# never overwrite an older badge of someone with the same name
+	def uniqueFilename(self, subdirectory, name, extension):
+		base = '%s_%s' % (name, time.strftime('%Y%m%d-%H%M%S'))
+		filename = os.path.join(self.directory, subdirectory, '%s.%s' % (base, extension))
+		suffix = 1
+		while os.path.exists(filename):
+			suffix += 1
+			filename = os.path.join(self.directory, subdirectory, '%s_%d.%s' % (base, suffix, extension))
+
+		return filename
+
+	def _insert(self, name, template, timestamp, fields, badgeFile, badgeHash, captureFile, captureHash):
+		cursor = self.db.execute(
+			'INSERT INTO badges (name, template, timestamp, fields, badgeFile, badgeHash, captureFile, captureHash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+			(name, template, timestamp, json.dumps(fields, sort_keys=True), badgeFile, badgeHash, captureFile, captureHash)
+		)
+		self.db.executemany(
+			'INSERT INTO terms (term, badge) VALUES (?, ?)',
+			[(term, cursor.lastrowid) for term in searchTerms(name)]
+		)
+		return cursor.lastrowid
+
+	# the capture may still be on its way to disk, so its hash comes from the data
+	def add(self, name, template, fields, badgeFile, captureFile=None, captureData=None):
+		badgeHash = fileHash(badgeFile)
+		captureHash = hashlib.sha256(captureData).hexdigest() if captureData is not None else None
+		# the badge is indexed completely or not at all; "with self.db" commits, or rolls back on an error
+		with self.db:
+			self.db.execute('BEGIN')
+			id = self._insert(name, template, int(time.time()), fields, badgeFile, badgeHash, captureFile, captureHash)
+		return id
+
+	# badges saved before there was an index only have their file name and date to go on
+	def importExisting(self):
+		badgeDirectory = os.path.join(self.directory, 'badges')
+		if not os.path.isdir(badgeDirectory):
+			return
+
+		with self.db:
+			self.db.execute('BEGIN')
+			for filename in sorted(os.listdir(badgeDirectory)):
+				if filename[-4:].lower() == '.svg':
+					path = os.path.join(badgeDirectory, filename)
+					self._insert(filename[:-4], None, int(os.path.getmtime(path)), {}, path, None, None, None)
+
+	def setSpool(self, id, renderer, data):
+		extension = SPOOL_EXTENSIONS.get(data[:4], 'bin')
+		spoolDirectory = os.path.join(self.directory, 'spool')
+		os.makedirs(spoolDirectory, exist_ok=True)
+
+		filename = os.path.join(spoolDirectory, '%s.%s' % (hashlib.sha256(data).hexdigest(), extension))
+		if not os.path.isfile(filename):
+			with open(filename, 'wb') as spoolFile:
+				spoolFile.write(data)
+
+		self.db.execute('UPDATE badges SET spoolFile = ?, spoolRenderer = ? WHERE id = ?', (filename, renderer, id))
+
+	def get(self, id):
+		row = self.db.execute('SELECT %s FROM badges WHERE id = ?' % BadgeArchive.COLUMNS, (id,)).fetchone()
+		return BadgeRecord(row) if row is not None else None
+
+	# every word of the query has to be the start of a word in the name, newest badges first
+	def search(self, query, limit=50):
+		terms = searchTerms(query)
+		if len(terms) == 0:
+			rows = self.db.execute(
+				'SELECT %s FROM badges ORDER BY timestamp DESC, id DESC LIMIT ?' % BadgeArchive.COLUMNS,
+				(limit,)
+			).fetchall()
+		else:
+			conditions = []
+			parameters = []
+			for term in terms:
+				# a range instead of LIKE, so SQLite can use the index
+				conditions.append('id IN (SELECT badge FROM terms WHERE term >= ? AND term < ?)')
+				parameters += [term, term + '\uffff']
+
+			rows = self.db.execute(
+				'SELECT %s FROM badges WHERE %s ORDER BY timestamp DESC, id DESC LIMIT ?' % (
+					BadgeArchive.COLUMNS, ' AND '.join(conditions)
+				),
+				parameters + [limit]
+			).fetchall()
+
+		return [BadgeRecord(row) for row in rows]
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, re, base64, hashlib, tempfile
+
+EXTENSIONS = {
+	'jpeg': 'jpg',
+	'png': 'png',
+}
+
+# Writes to a temporary file next to path, then renames it, so a half-written file never has
+# the final name. Anything looking for the file finds all of it or none of it.
+def writeAtomically(path, data):
+	tmpFile, tmpFilename = tempfile.mkstemp(dir=os.path.dirname(path))
+	try:
+		with os.fdopen(tmpFile, 'wb') as outputFile:
+			outputFile.write(data)
+		os.replace(tmpFilename, path)
+	except OSError:
+		if os.path.exists(tmpFilename):
+			os.remove(tmpFilename)
+		raise
+
+# Content-addressed image storage: identical images are only ever stored once
+class AssetStore(object):
+	def __init__(self, directory):
+		self.directory = directory
+		os.makedirs(directory, exist_ok=True)
+
+	def path(self, data, imageType):
+		return os.path.join(self.directory, '%s.%s' % (hashlib.sha256(data).hexdigest(), EXTENSIONS[imageType]))
+
+	def put(self, data, imageType):
+		path = self.path(data, imageType)
+		if not os.path.isfile(path):
+			writeAtomically(path, data)
+
+		return path
+
+	# makes filename refer to the stored copy, without using any more disk space
+	def link(self, data, imageType, filename):
+		path = self.put(data, imageType)
+		if os.path.exists(filename):
+			os.remove(filename)
+		try:
+			os.link(path, filename)
+		except OSError:
+			with open(filename, 'wb') as outputFile:
+				outputFile.write(data)
+
+		return filename
+
+_hrefPattern = re.compile(r'xlink:href="(?!data:|#)([^"]+)"')
+_schemePattern = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*:')
+
+# Inlines linked images as data URIs, producing a single self-contained SVG.
+# Only local image files that exist are inlined; URLs and anything else are left as they are.
+def pack(content, baseDir):
+	def inline(match):
+		href = match.group(1)
+		if _schemePattern.match(href):
+			return match.group(0)
+
+		path = os.path.join(baseDir, href)
+		extension = os.path.splitext(path)[1].lower().lstrip('.')
+		imageType = 'jpeg' if extension in ('jpg', 'jpeg') else extension
+		if imageType not in EXTENSIONS or not os.path.isfile(path):
+			return match.group(0)
+
+		with open(path, 'rb') as assetFile:
+			data = base64.b64encode(assetFile.read()).decode('ascii')
+		return 'xlink:href="data:image/%s;base64,%s"' % (imageType, data)
+
+	if isinstance(content, bytes):
+		return _hrefPattern.sub(inline, content.decode('utf-8')).encode('utf-8')
+
+	return _hrefPattern.sub(inline, content)
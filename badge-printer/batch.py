@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, sys, csv, json, time
+import multiprocessing
+
+from template import BadgeTemplate, fileFriendlyName
+from qr import makeQR, profileURL
+from imposition import SheetLayout, impose
+import photo
+from archive import BadgeArchive
+
+def readRoster(filename):
+	if filename.lower().endswith('.json'):
+		with open(filename, encoding='utf-8-sig') as rosterFile:
+			content = rosterFile.read().strip()
+
+		# either a JSON array of objects or JSON lines, like archive/log.txt
+		if content.startswith('['):
+			return json.loads(content)
+		else:
+			return [json.loads(line) for line in content.splitlines() if line.strip() != '']
+	else:
+		# Excel's "CSV UTF-8" starts with a byte order mark, which would end up in the first header
+		with open(filename, newline='', encoding='utf-8-sig') as rosterFile:
+			return list(csv.DictReader(rosterFile))
+
+def _fieldValue(row, id):
+	for key, value in row.items():
+		if key is not None and key.strip().lower() == id.lower():
+			return '' if value is None else str(value)
+
+	return None
+
+def _rowNames(row):
+	return [_fieldValue(row, 'first name') or '', _fieldValue(row, 'last name') or '']
+
+def _renderRow(args):
+	templateFilename, outputFilename, row, fitText = args
+	try:
+		template = BadgeTemplate(templateFilename, fitText)
+		fields = {}
+		for field in template.fields():
+			value = _fieldValue(row, field['id'])
+			if value is None and field['id'].lower() == 'date':
+				value = time.strftime('%Y %B %d')
+			if value is not None:
+				template.setText(field['id'], value)
+				fields[field['id']] = value
+
+		qrText = _fieldValue(row, 'qr') or profileURL(fileFriendlyName(_rowNames(row), False))
+		template.setImage('qr', makeQR(qrText), 'png')
+
+		photoFilename = _fieldValue(row, 'photo')
+		if photoFilename:
+			with open(photoFilename, 'rb') as photoFile:
+				data, imageType = photoFile.read(), photo.imageTypeForFilename(photoFilename)
+			boxSize = template.elementSize('photo') if template.hasElement('photo') else None
+			if boxSize is not None:
+				data, imageType = photo.preparePhoto(data, imageType, boxSize)
+			template.setImage('photo', data, imageType)
+
+		with open(outputFilename, 'w', encoding='utf-8') as saveFile:
+			saveFile.write(template.toString())
+
+		return outputFilename, fields, None
+	except Exception as exc:
+		return outputFilename, None, exc
+
+def _imposeSheet(args):
+	badgeFilenames, layout, outputFilename = args
+	try:
+		badges = []
+		for filename in badgeFilenames:
+			with open(filename, 'rb') as badgeFile:
+				badges.append(badgeFile.read())
+
+		with open(outputFilename, 'wb') as sheetFile:
+			sheetFile.write(impose(badges, layout))
+
+		return outputFilename, None
+	except Exception as exc:
+		return outputFilename, exc
+
+# With an archive, the badges are named and recorded like printed ones, so they can be
+# found and reprinted later; otherwise they're written to outputDir as <name>.svg.
+# With a sheetLayout, the badges are also laid out on sheets in sheetDir, in roster order
+def run(templateFilename, rosterFilename, outputDir=os.path.join('archive', 'badges'), processes=None,
+		sheetLayout=None, sheetDir=os.path.join('archive', 'sheets'), fitText=True, archive=None):
+	rows = readRoster(rosterFilename)
+	if archive is not None:
+		outputDir = os.path.join(archive.directory, 'badges')
+	os.makedirs(outputDir, exist_ok=True)
+
+	# parse once in the parent so forked workers inherit the parsed template (and its fonts)
+	template = BadgeTemplate(templateFilename)
+	if fitText:
+		for field in template.fields():
+			template.info.textBox(field['id'])
+
+	jobs = []
+	names = {}
+	usedNames = set()
+	for row in rows:
+		name = fileFriendlyName(_rowNames(row))
+		uniqueName = name
+		suffix = 1
+		while uniqueName in usedNames:
+			suffix += 1
+			uniqueName = '%s_%d' % (name, suffix)
+		usedNames.add(uniqueName)
+
+		if archive is not None:
+			outputFilename = archive.uniqueFilename('badges', uniqueName, 'svg')
+		else:
+			outputFilename = os.path.join(outputDir, '%s.svg' % uniqueName)
+		names[outputFilename] = name
+		jobs.append((templateFilename, outputFilename, row, fitText))
+
+	failures = 0
+	written = set()
+	startTime = time.time()
+	with multiprocessing.Pool(processes) as pool:
+		chunkSize = max(1, len(jobs) // (4 * (processes or os.cpu_count() or 1)))
+		for filename, fields, error in pool.imap_unordered(_renderRow, jobs, chunkSize):
+			if error is None and archive is not None:
+				try:
+					archive.add(names[filename], templateFilename, fields, filename)
+				except Exception as exc:
+					# the badge is still there, it just won't turn up in a search
+					print('Failed to index %s: %s' % (filename, exc), file=sys.stderr)
+			if error is None:
+				written.add(filename)
+				print(filename)
+			else:
+				failures += 1
+				print('Failed to render %s: %s' % (filename, error), file=sys.stderr)
+
+		print('%d badges written to %s in %.2fs (%d failed)' % (
+			len(jobs) - failures, outputDir, time.time() - startTime, failures
+		))
+
+		if sheetLayout is not None:
+			os.makedirs(sheetDir, exist_ok=True)
+			badgeFilenames = [job[1] for job in jobs if job[1] in written]
+			capacity = sheetLayout.capacity
+			sheets = [
+				(badgeFilenames[i:i+capacity], sheetLayout, os.path.join(sheetDir, 'sheet-%03d.svg' % (i // capacity + 1)))
+				for i in range(0, len(badgeFilenames), capacity)
+			]
+
+			sheetFailures = 0
+			startTime = time.time()
+			for filename, error in pool.imap_unordered(_imposeSheet, sheets):
+				if error is None:
+					print(filename)
+				else:
+					sheetFailures += 1
+					print('Failed to lay out %s: %s' % (filename, error), file=sys.stderr)
+
+			print('%d sheets of %s written to %s in %.2fs (%d failed)' % (
+				len(sheets) - sheetFailures, sheetLayout, sheetDir, time.time() - startTime, sheetFailures
+			))
+			failures += sheetFailures
+
+	return 0 if failures == 0 else 1
+
+# Runs --batch from the command line. This is called before any of the GUI is imported,
+# so it works on machines without a display.
+def main(args):
+	os.makedirs(os.path.join('archive', 'badges'), exist_ok=True)
+
+	if '--template' not in args:
+		print('--batch requires --template', file=sys.stderr)
+		return 2
+
+	processes = None
+	if '--jobs' in args:
+		processes = int(args[1+args.index('--jobs')])
+
+	badgeArchive = BadgeArchive('archive')
+	try:
+		return run(
+			os.path.join('templates', args[1+args.index('--template')]),
+			args[1+args.index('--batch')],
+			processes=processes,
+			sheetLayout=SheetLayout.fromArgs(args),
+			fitText='--no-text-fit' not in args,
+			archive=badgeArchive
+		)
+	finally:
+		badgeArchive.close()
@@ -0,0 +1,610 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Headless benchmarks for the badge pipeline. No camera, printer, network or display is needed:
+# Qt runs offscreen, and inkscape, lpr and lpstat are replaced by stub executables for the duration.
+#
+#   python3 badge-printer/benchmark.py --output before.json
+#   python3 badge-printer/benchmark.py --compare before.json
+#
+# The stubs answer instantly, so render and print times are the app's own overhead
+# (processes, pipes, temp files and queues), not Inkscape's.
+
+import os, sys, json, time, random, base64, shutil, subprocess, tempfile, threading, platform
+import http.server
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5 import QtCore, QtGui
+
+import qr
+from template import BadgeTemplate, registry, fileFriendlyName
+from printing import PrintJob, PrintWorkerThread, PrinterPool, printerNames
+from renderer import RENDERERS
+from rendercache import RenderCache
+from log import WebFormLogger
+from devices import DeviceWatcher
+import windowwatcher
+from windowwatcher import WindowWatcher
+import assets
+
+BASE_PATH = os.path.dirname(os.path.realpath(__file__))
+TEMPLATES = ['member.svg', 'guest.svg', 'board-member.svg']
+
+STUB_INKSCAPE = '''#!%s
+import sys
+
+def export(svgFilename, psFilename):
+	with open(svgFilename, 'rb') as svgFile:
+		size = len(svgFile.read())
+	with open(psFilename, 'wb') as psFile:
+		psFile.write(b'%%!PS-Adobe-3.0\\n%%%% stub render of ' + str(size).encode('ascii') + b' bytes\\n')
+
+args = sys.argv[1:]
+if args == ['--version']:
+	print('Inkscape 1.0 (stub)')
+elif args == ['--shell']:
+	sys.stdout.write('Inkscape interactive shell mode.\\n> ')
+	sys.stdout.flush()
+	for line in sys.stdin:
+		if line.strip() == 'quit':
+			break
+		commands = dict(part.strip().split(':', 1) for part in line.split(';') if ':' in part)
+		if 'file-open' in commands and 'export-filename' in commands:
+			export(commands['file-open'], commands['export-filename'])
+		sys.stdout.write('> ')
+		sys.stdout.flush()
+elif len(args) == 3 and args[0] == '-P':
+	export(args[2], args[1])
+else:
+	sys.exit('unsupported stub arguments: %%s' %% args)
+''' % sys.executable
+
+# refuses jobs for the printers that setPrinters() marked as failing
+STUB_LPR = '''#!/bin/sh
+cat > /dev/null
+if [ "$1" = "-P" ] && [ -e "$(dirname "$0")/failing/$2" ]; then
+	echo "lpr: $2 is not accepting jobs" >&2
+	exit 1
+fi
+'''
+
+# answers like CUPS for the printers in printers.json, see setPrinters()
+STUB_LPSTAT = '''#!%s
+import os, sys, json
+
+with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'printers.json')) as printersFile:
+	printers = json.load(printersFile)
+
+args = sys.argv[1:]
+if args == ['-e']:
+	for name in printers:
+		print(name)
+elif len(args) == 4 and args[0] == '-p' and args[2] == '-o':
+	name = args[1]
+	if name not in printers:
+		sys.exit('lpstat: Invalid destination name in list "%%s".' %% name)
+	if printers[name]['enabled']:
+		print('printer %%s is idle.  enabled since Thu 01 Jan 1970 00:00:00' %% name)
+	else:
+		print('printer %%s disabled since Thu 01 Jan 1970 00:00:00 -' %% name)
+		print('\\tPaused')
+	for i in range(printers[name]['jobs']):
+		print('%%s-%%d    kiosk    1024   Thu 01 Jan 1970 00:00:00' %% (name, i + 1))
+else:
+	sys.exit('unsupported stub arguments: %%s' %% args)
+''' % sys.executable
+
+def installStubs(directory):
+	for name, script in [('inkscape', STUB_INKSCAPE), ('lpr', STUB_LPR), ('lpstat', STUB_LPSTAT)]:
+		path = os.path.join(directory, name)
+		with open(path, 'w') as stubFile:
+			stubFile.write(script)
+		os.chmod(path, 0o755)
+
+	os.makedirs(os.path.join(directory, 'failing'))
+	setPrinters(directory, {'benchmark': {}})
+	os.environ['PATH'] = directory + os.pathsep + os.environ['PATH']
+
+# The printers the stubs know about, as {name: {'enabled': bool, 'jobs': int, 'failing': bool}}.
+# A failing printer looks fine to lpstat, but lpr refuses its jobs.
+def setPrinters(directory, printers):
+	with open(os.path.join(directory, 'printers.json'), 'w') as printersFile:
+		json.dump(dict(
+			(name, {'enabled': status.get('enabled', True), 'jobs': status.get('jobs', 0)})
+			for name, status in printers.items()
+		), printersFile)
+
+	for name in os.listdir(os.path.join(directory, 'failing')):
+		os.remove(os.path.join(directory, 'failing', name))
+	for name, status in printers.items():
+		if status.get('failing', False):
+			open(os.path.join(directory, 'failing', name), 'w').close()
+
+def encodeImage(image, format):
+	buffer = QtCore.QBuffer()
+	buffer.open(QtCore.QIODevice.WriteOnly)
+	image.save(buffer, format)
+	return bytes(buffer.data())
+
+def samplePhoto():
+	image = QtGui.QImage(640, 480, QtGui.QImage.Format_RGB32)
+	painter = QtGui.QPainter(image)
+	gradient = QtGui.QLinearGradient(0, 0, 640, 480)
+	gradient.setColorAt(0, QtGui.QColor('#336699'))
+	gradient.setColorAt(1, QtGui.QColor('#ffcc99'))
+	painter.fillRect(image.rect(), gradient)
+	painter.end()
+	return encodeImage(image, 'JPG')
+
+# Lots of fields and a big embedded background, so the document is well past WebViewer.MAX_CONTENT_SIZE
+def writeLargeTemplate(filename, fields=100, backgroundSize=1200):
+	# seeded noise doesn't compress, and comes out the same every run
+	size = backgroundSize * backgroundSize * 3
+	noise = random.Random(0).getrandbits(8 * size).to_bytes(size, 'little')
+	image = QtGui.QImage(noise, backgroundSize, backgroundSize, backgroundSize * 3, QtGui.QImage.Format_RGB888)
+	background = base64.b64encode(encodeImage(image, 'PNG')).decode('ascii')
+
+	texts = ''.join(
+		'<text x="10" y="%d" id="Field %d" style="font-size:4px;font-family:Arial"><tspan x="10" y="%d">Field %d</tspan></text>\n' % (
+			20 + 3 * i, i, 20 + 3 * i, i
+		)
+		for i in range(fields)
+	)
+	with open(filename, 'w') as templateFile:
+		templateFile.write(
+			'<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
+			'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+			'width="204" height="384" viewBox="0 0 204 384" version="1.1">\n'
+			'<image id="background" x="0" y="0" width="204" height="384" xlink:href="data:image/png;base64,%s"/>\n'
+			'<text x="100" y="10" id="First name"><tspan x="100" y="10">First Name</tspan></text>\n'
+			'<text x="100" y="16" id="Last name"><tspan x="100" y="16">Last Name</tspan></text>\n'
+			'%s'
+			'<image id="photo" x="52" y="200" width="100" height="120" preserveAspectRatio="xMidYMid slice"/>\n'
+			'<image id="qr" x="77" y="330" width="50" height="50"/>\n'
+			'</svg>\n' % (background, texts)
+		)
+
+def statistics(times):
+	times = sorted(times)
+	return {
+		'runs': len(times),
+		'min_ms': times[0] * 1000,
+		'median_ms': times[len(times) // 2] * 1000,
+		'p95_ms': times[min(len(times) - 1, int(0.95 * len(times)))] * 1000,
+		'max_ms': times[-1] * 1000,
+	}
+
+def measure(function, repeat, setup=None):
+	times = []
+	for i in range(repeat):
+		if setup is not None:
+			setup()
+		start = time.perf_counter()
+		function()
+		times.append(time.perf_counter() - start)
+
+	return statistics(times)
+
+def filledTemplate(filename, photo):
+	template = BadgeTemplate(filename)
+	template.setText('First name', 'Alexandria')
+	template.setText('Last name', 'Ocasio')
+	template.setImage('qr', qr.makeQR(qr.profileURL('Alexandria_Ocasio')), 'png')
+	if template.hasElement('photo'):
+		template.setImage('photo', photo, 'jpeg')
+	return template
+
+def benchmarkTemplateLoad(filename, repeat):
+	return {
+		'template load (parse)': measure(lambda: BadgeTemplate(filename), repeat, lambda: registry.remove(filename)),
+		'template load (cached)': measure(lambda: BadgeTemplate(filename), repeat),
+	}
+
+# What the GUI thread does per keystroke, with a preview update after each one: textFieldUpdated
+# sets (and fits) the text and works out the QR code's URL, then _refreshPreview hands the page
+# its one batched change, as WebViewer.updateDocument serializes it.
+def benchmarkKeystroke(filename, repeat):
+	typed = 'Alexandria Ocasio-Cortez'
+
+	def keystrokes(fitText):
+		template = BadgeTemplate(filename, fitText)
+
+		def typeName():
+			for i in range(1, len(typed) + 1):
+				template.setText('First name', typed[:i])
+				qr.profileURL(fileFriendlyName([typed[:i], 'Ocasio'], False))
+
+				texts, markup = {'First name': typed[:i]}, {}
+				if template.fitText:
+					texts, markup = {}, dict((id, template.textMarkup(id)) for id in texts)
+				for change in (texts, {}, markup):
+					json.dumps(change)
+
+		result = measure(typeName, repeat)
+		for key in ('min_ms', 'median_ms', 'p95_ms', 'max_ms'):
+			result[key] /= len(typed)
+		return result, template
+
+	result, template = keystrokes(True)
+	return {
+		'keystroke preview update': result,
+		'keystroke (no text fit)': keystrokes(False)[0],
+		'full preview document': measure(template.toBytes, repeat),
+	}
+
+def benchmarkQR(repeat):
+	texts = [qr.profileURL('Member_%d' % i) for i in range(repeat)]
+
+	def uncached():
+		qr.qrMatrix.cache_clear()
+		qr.makeQR.cache_clear()
+		qr.makeQR(texts.pop())
+
+	cachedText = qr.profileURL('Member')
+	qr.makeQR(cachedText)
+	return {
+		'QR (uncached)': measure(uncached, repeat),
+		'QR (cache hit)': measure(lambda: qr.makeQR(cachedText), repeat),
+	}
+
+def benchmarkSave(filename, photo, workDirectory, repeat):
+	template = filledTemplate(filename, photo)
+	store = assets.AssetStore(os.path.join(workDirectory, 'assets'))
+	badgeFilename = os.path.join(workDirectory, 'badge.svg')
+
+	def save():
+		with open(badgeFilename, 'w') as badgeFile:
+			badgeFile.write(template.toString())
+
+	def saveLinked():
+		with open(badgeFilename, 'w') as badgeFile:
+			badgeFile.write(template.toString(store, workDirectory))
+
+	return {
+		'badge save': measure(save, repeat),
+		'badge save (linked images)': measure(saveLinked, repeat),
+	}
+
+def benchmarkPrint(filename, photo, workDirectory, repeat):
+	template = filledTemplate(filename, photo)
+	content = template.toBytes()
+	results = {}
+
+	for name in sorted(RENDERERS):
+		worker = PrintWorkerThread(None, name)
+		worker.renderer(name)
+		try:
+			results['render + lpr (%s)' % name] = measure(
+				lambda: worker.process(PrintJob('benchmark', content, 'benchmark', name)), repeat
+			)
+		finally:
+			for renderer in worker.renderers.values():
+				renderer.close()
+
+	# the template's artwork parsed once, with the layers worked out per badge like Quick Print does
+	worker = PrintWorkerThread(None, 'qt')
+	def printLayered():
+		job = PrintJob('benchmark', content, 'benchmark', 'qt')
+		job.layers = template.layers()
+		worker.process(job)
+	printLayered()
+	results['render + lpr (qt, layers)'] = measure(printLayered, repeat)
+
+	cache = RenderCache(os.path.join(workDirectory, 'render-cache'))
+	worker = PrintWorkerThread(None, 'qt', cache)
+	worker.process(PrintJob('benchmark', content, 'benchmark', 'qt'))
+	results['render cache hit + lpr'] = measure(
+		lambda: worker.process(PrintJob('benchmark', content, 'benchmark', 'qt')), repeat
+	)
+
+	return results
+
+def expect(actual, expected, what):
+	if actual != expected:
+		raise AssertionError('%s: expected %s, got %s' % (what, expected, actual))
+
+# Checks that the pool picks the shortest queue and works around printers that can't print,
+# then times choosing a printer and spooling through the pool
+def benchmarkPrinterPool(stubDirectory, repeat):
+	def spoolJob():
+		return PrintJob('benchmark', None, None, spool=b'%!PS-Adobe-3.0\n', pool=pool)
+
+	printers = {
+		'busy': {'jobs': 3},
+		'idle': {'jobs': 0},
+		'quiet': {'jobs': 1},
+	}
+	try:
+		setPrinters(stubDirectory, printers)
+		expect(sorted(printerNames()), sorted(printers), 'printer pool printer list')
+		pool = PrinterPool(printerNames())
+		expect(pool.choose(), 'idle', 'printer pool choice by queue depth')
+
+		printers['idle']['enabled'] = False
+		setPrinters(stubDirectory, printers)
+		expect(pool.choose(), 'quiet', 'printer pool choice with the idle printer disabled')
+
+		# quiet refuses the job, so it goes to the next best printer, and quiet is skipped after that
+		printers['quiet']['failing'] = True
+		setPrinters(stubDirectory, printers)
+		job = spoolJob()
+		expect(pool.spool(job), 'busy', 'printer pool failover from a failing printer')
+		expect(job.printerName, 'busy', 'printer pool printer recorded on the job')
+		expect(pool.choose(), 'busy', 'printer pool choice while the failed printer is skipped')
+
+		setPrinters(stubDirectory, {'busy': {'jobs': 3}, 'idle': {}, 'quiet': {'jobs': 1}})
+		pool = PrinterPool(printerNames())
+		return {
+			'printer pool choice': measure(pool.choose, repeat),
+			'printer pool lpr': measure(lambda: pool.spool(spoolJob()), repeat),
+		}
+	finally:
+		setPrinters(stubDirectory, {'benchmark': {}})
+
+# Stands in for Inkscape and an EWMH window manager on an Xvfb display: maps windows for a pid,
+# lists them in _NET_CLIENT_LIST and makes them active, and names them, optionally a bit later
+class _FakeEWMHClient(object):
+	def __init__(self, displayName):
+		self.display = windowwatcher.xdisplay.Display(displayName)
+		self.root = self.display.screen().root
+
+	def close(self):
+		self.display.close()
+
+	def _atom(self, name):
+		return self.display.intern_atom(name)
+
+	def openWindow(self, pid, title, titleDelay=0.0):
+		X, Xatom = windowwatcher.X, windowwatcher.Xatom
+		window = self.root.create_window(0, 0, 100, 100, 0, X.CopyFromParent)
+		window.change_property(self._atom('_NET_WM_PID'), Xatom.CARDINAL, 32, [pid])
+		window.set_wm_class('inkscape', 'Inkscape')
+		window.map()
+
+		clientList = self.root.get_full_property(self._atom('_NET_CLIENT_LIST'), Xatom.WINDOW)
+		windowIDs = list(clientList.value) if clientList is not None else []
+		self.root.change_property(self._atom('_NET_CLIENT_LIST'), Xatom.WINDOW, 32, windowIDs + [window.id])
+		self.root.change_property(self._atom('_NET_ACTIVE_WINDOW'), Xatom.WINDOW, 32, [window.id])
+		self.display.sync()
+
+		# Inkscape names its print dialog after mapping it
+		time.sleep(titleDelay)
+		window.change_property(self._atom('_NET_WM_NAME'), self._atom('UTF8_STRING'), 8, title.encode('utf-8'))
+		self.display.sync()
+		return window.id
+
+def startXvfb():
+	readFD, writeFD = os.pipe()
+	try:
+		server = subprocess.Popen(
+			['Xvfb', '-displayfd', str(writeFD), '-nolisten', 'tcp'],
+			pass_fds=(writeFD,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+		)
+	finally:
+		os.close(writeFD)
+
+	with os.fdopen(readFD) as displayFile:
+		displayNumber = displayFile.readline().strip()
+	if displayNumber == '':
+		server.kill()
+		raise RuntimeError('Xvfb did not start')
+
+	return server, ':' + displayNumber
+
+# Checks that the watcher finds Inkscape's print dialog, even when it's named after being mapped,
+# and hides the main window, then times how long it takes to notice a new window.
+# Needs Xvfb and python-xlib; without them there's nothing to measure.
+def benchmarkWindowWatcher(repeat):
+	if windowwatcher.xdisplay is None or shutil.which('Xvfb') is None:
+		print('Skipping the window watcher: it needs Xvfb and python-xlib')
+		return {}
+
+	server, displayName = startXvfb()
+	client = _FakeEWMHClient(displayName)
+	watcher = WindowWatcher(displayName)
+	try:
+		pids = iter(range(100000, 200000))
+
+		def openLater(pid, title, titleDelay=0.0):
+			thread = threading.Thread(target=client.openWindow, args=(pid, title, titleDelay))
+			thread.start()
+			return thread
+
+		pid = next(pids)
+		client.openWindow(next(pids), 'Print') # someone else's
+		mainID = client.openWindow(pid, 'badge.svg - Inkscape')
+		opening = openLater(pid, 'Print', 0.2)
+		printID = watcher.waitForWindow(pid, 'Print', timeout=5)
+		opening.join()
+		expect(printID is not None and printID != mainID, True, 'window watcher found the print dialog')
+		expect(watcher.findWindow(pid, 'Inkscape'), mainID, 'window watcher found the main window')
+
+		watcher.hideWindow(mainID)
+		mapState = client.display.create_resource_object('window', mainID).get_attributes().map_state
+		expect(mapState, windowwatcher.X.IsUnmapped, 'window watcher hid the main window')
+
+		def waitForNewWindow():
+			pid = next(pids)
+			opening = openLater(pid, 'Print')
+			watcher.waitForWindow(pid, 'Print', timeout=5)
+			opening.join()
+
+		return {'window watcher (new window)': measure(waitForNewWindow, repeat)}
+	finally:
+		watcher.close()
+		client.close()
+		server.terminate()
+		server.wait()
+
+class _FakeCameraInfo(object):
+	def __init__(self, deviceName):
+		self._deviceName = deviceName
+
+	def deviceName(self):
+		return self._deviceName
+
+# DeviceWatcher with the cameras it finds scripted, instead of asking Qt
+class _ScriptedDeviceWatcher(DeviceWatcher):
+	def __init__(self, deviceNames):
+		super().__init__(0)
+		self.deviceNames = deviceNames
+
+	def scanCameras(self):
+		self.cameras = dict((name, _FakeCameraInfo(name)) for name in self.deviceNames)
+		return list(self.cameras.values())
+
+# Unplugs two cameras at once, including the one in use, and checks that the app's
+# handling of cameraRemoved carries on with the camera that's left
+def checkCameraRemoval():
+	watcher = _ScriptedDeviceWatcher(['/dev/video0', '/dev/video1', '/dev/video2'])
+	watcher.scanCameras()
+	menu = set(watcher.cameras)
+	current = ['/dev/video0']
+
+	# what BadgePrinterApp._cameraRemoved does with the menu and the current camera
+	def cameraRemoved(deviceName):
+		menu.discard(deviceName)
+		if current[0] == deviceName:
+			cameraInfo = watcher.firstCamera(menu)
+			current[0] = cameraInfo.deviceName() if cameraInfo is not None else None
+
+	watcher.cameraRemoved.connect(cameraRemoved)
+	watcher.deviceNames = ['/dev/video2']
+	watcher.rescanCameras()
+	expect(current[0], '/dev/video2', 'camera after unplugging two at once')
+
+	watcher.deviceNames = []
+	watcher.rescanCameras()
+	expect(current[0], None, 'camera after unplugging the last one')
+
+# stands in for the sign-in sheet's web form, answering every entry with "ok"
+class _FormHandler(http.server.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	# headers and body go out in separate writes, which Nagle would hold up
+	disable_nagle_algorithm = True
+
+	def do_GET(self):
+		self.send_response(200)
+		self.send_header('Content-Length', '2')
+		self.end_headers()
+		self.wfile.write(b'ok')
+
+	def log_message(self, *args):
+		pass
+
+def benchmarkLogger(application, workDirectory, entries):
+	server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _FormHandler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+
+	logger = WebFormLogger(
+		'http://127.0.0.1:%d/exec' % server.server_address[1],
+		os.path.join(workDirectory, 'log.txt'),
+		os.path.join(workDirectory, 'outbox.sqlite3')
+	)
+	try:
+		times = []
+		start = time.perf_counter()
+		for i in range(entries):
+			entryStart = time.perf_counter()
+			logger.logEntry({'First name': 'Member', 'Last name': '%d' % i})
+			times.append(time.perf_counter() - entryStart)
+
+		while len(logger.outbox) > 0:
+			application.processEvents()
+			time.sleep(0.001)
+		elapsed = time.perf_counter() - start
+	finally:
+		logger.shutdown()
+		server.shutdown()
+		server.server_close()
+
+	throughput = statistics([elapsed / entries])
+	throughput['entries_per_second'] = entries / elapsed
+	return {
+		'log entry (GUI thread)': statistics(times),
+		'log send throughput': throughput,
+	}
+
+def gitCommit():
+	try:
+		return subprocess.check_output(
+			['git', 'rev-parse', 'HEAD'], cwd=BASE_PATH, stderr=subprocess.DEVNULL
+		).decode('ascii').strip()
+	except Exception:
+		return None
+
+def run(repeat=20, templates=None, output=None):
+	application = QtGui.QGuiApplication(sys.argv[:1])
+	workDirectory = tempfile.mkdtemp(prefix='badge-benchmark-')
+	try:
+		stubDirectory = os.path.join(workDirectory, 'bin')
+		os.makedirs(stubDirectory)
+		installStubs(stubDirectory)
+
+		if templates is None:
+			templates = [os.path.join(BASE_PATH, '..', 'templates', name) for name in TEMPLATES]
+			largeTemplate = os.path.join(workDirectory, 'synthetic-large.svg')
+			writeLargeTemplate(largeTemplate)
+			templates.append(largeTemplate)
+
+		photo = samplePhoto()
+		results = {}
+
+		def add(template, measurements):
+			for benchmark, result in measurements.items():
+				results.setdefault(benchmark, {})[template] = result
+				print('%-28s %-22s %10.3f ms (median of %d)' % (benchmark, template, result['median_ms'], result['runs']))
+
+		for filename in templates:
+			name = os.path.basename(filename)
+			add(name, benchmarkTemplateLoad(filename, repeat))
+			add(name, benchmarkKeystroke(filename, repeat))
+			add(name, benchmarkSave(filename, photo, workDirectory, repeat))
+			add(name, benchmarkPrint(filename, photo, workDirectory, repeat))
+
+		add('-', benchmarkQR(repeat))
+		add('-', benchmarkPrinterPool(stubDirectory, repeat))
+		checkCameraRemoval()
+		add('-', benchmarkWindowWatcher(repeat))
+		add('-', benchmarkLogger(application, workDirectory, 10 * repeat))
+	finally:
+		shutil.rmtree(workDirectory, ignore_errors=True)
+
+	report = {
+		'commit': gitCommit(),
+		'timestamp': int(time.time()),
+		'python': platform.python_version(),
+		'qt': QtCore.QT_VERSION_STR,
+		'platform': platform.platform(),
+		'repeat': repeat,
+		'results': results,
+	}
+	if output is not None:
+		with open(output, 'w') as outputFile:
+			json.dump(report, outputFile, indent=1, sort_keys=True)
+
+	return report
+
+def compare(old, new):
+	print('\n%-28s %-22s %10s %10s %8s' % ('benchmark', 'template', 'old (ms)', 'new (ms)', 'change'))
+	for benchmark in sorted(new['results']):
+		for template in sorted(new['results'][benchmark]):
+			oldResult = old['results'].get(benchmark, {}).get(template)
+			if oldResult is None:
+				continue
+			oldTime, newTime = oldResult['median_ms'], new['results'][benchmark][template]['median_ms']
+			print('%-28s %-22s %10.3f %10.3f %+7.0f%%' % (
+				benchmark, template, oldTime, newTime, 100 * (newTime - oldTime) / oldTime if oldTime > 0 else 0
+			))
+
+if __name__ == '__main__':
+	args = sys.argv
+	repeat = int(args[1+args.index('--repeat')]) if '--repeat' in args else 20
+	output = args[1+args.index('--output')] if '--output' in args else None
+	templates = [args[1+args.index('--template')]] if '--template' in args else None
+
+	report = run(repeat, templates, output)
+	if '--compare' in args:
+		with open(args[1+args.index('--compare')]) as oldFile:
+			compare(json.load(oldFile), report)
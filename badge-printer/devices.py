@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from PyQt5 import QtCore, QtMultimedia, QtPrintSupport
+
+import os
+
+from startup import BackgroundCall
+from printing import printerNames, printerInfos
+
+# CUPS rewrites this whenever a queue is added, removed or changed. The file itself is
+# usually only readable by root, so its directory is watched instead.
+CUPS_DIRECTORY = '/etc/cups'
+CUPS_PRINTERS_CONF = os.path.join(CUPS_DIRECTORY, 'printers.conf')
+
+def _modifiedTime(path):
+	try:
+		return os.stat(path).st_mtime_ns
+	except OSError:
+		return None
+
+def _videoDevices():
+	try:
+		return set(filename for filename in os.listdir('/dev') if filename.startswith('video'))
+	except OSError:
+		return set()
+
+# Reports cameras and printers as they come and go. Cameras are looked for again when a
+# /dev/video* node appears or disappears (or every pollInterval seconds where there is no
+# /dev to watch). Printers are listed with lpstat in the background every pollInterval
+# seconds, and right away when CUPS rewrites its list of queues.
+class DeviceWatcher(QtCore.QObject):
+	cameraAdded = QtCore.pyqtSignal(object)
+	cameraRemoved = QtCore.pyqtSignal(str)
+	printerAdded = QtCore.pyqtSignal(object)
+	printerRemoved = QtCore.pyqtSignal(str)
+
+	def __init__(self, pollInterval=15.0, parent=None):
+		super().__init__(parent)
+		self.cameras = {}
+		self.printers = None
+		self.videoDevices = _videoDevices()
+		self.printerCall = None
+		self.printerPollAgain = False
+
+		self.watcher = QtCore.QFileSystemWatcher(self)
+		self.watcher.directoryChanged.connect(self._directoryChanged)
+
+		# udev creates the node first and sets its permissions after, so wait for things to settle
+		self.cameraTimer = QtCore.QTimer(self)
+		self.cameraTimer.setSingleShot(True)
+		self.cameraTimer.setInterval(500)
+		self.cameraTimer.timeout.connect(self.rescanCameras)
+
+		self.pollTimer = QtCore.QTimer(self)
+		self.pollTimer.setInterval(int(pollInterval * 1000))
+		self.pollTimer.timeout.connect(self.pollPrinters)
+
+		self.watchingDevices = os.path.isdir('/dev') and self.watcher.addPath('/dev')
+		if not self.watchingDevices:
+			print('Could not watch /dev, cameras will only be found by polling')
+			self.pollTimer.timeout.connect(self.rescanCameras)
+
+		self.printersConfTime = _modifiedTime(CUPS_PRINTERS_CONF)
+		self.watchingPrinters = os.path.isdir(CUPS_DIRECTORY) and self.watcher.addPath(CUPS_DIRECTORY)
+		if not self.watchingPrinters:
+			print('Could not watch %s, printer changes will only be found by polling' % CUPS_DIRECTORY)
+
+	def start(self):
+		self.pollTimer.start()
+
+	def stop(self):
+		self.pollTimer.stop()
+		self.cameraTimer.stop()
+		if self.printerCall is not None:
+			self.printerCall.wait()
+
+	def _directoryChanged(self, path):
+		if path == CUPS_DIRECTORY:
+			self._cupsChanged()
+		else:
+			self._devicesChanged()
+
+	def _devicesChanged(self):
+		# all sorts of things come and go in /dev, so only cameras are worth a rescan
+		videoDevices = _videoDevices()
+		if videoDevices != self.videoDevices:
+			self.videoDevices = videoDevices
+			self.cameraTimer.start()
+
+	def _cupsChanged(self):
+		# CUPS keeps other things in here too, only a new list of printers matters
+		printersConfTime = _modifiedTime(CUPS_PRINTERS_CONF)
+		if printersConfTime != self.printersConfTime:
+			self.printersConfTime = printersConfTime
+			self.pollPrinters()
+
+	# lists the cameras without reporting any changes, for starting over
+	def scanCameras(self):
+		availableCameras = QtMultimedia.QCameraInfo.availableCameras()
+		self.cameras = dict((cameraInfo.deviceName(), cameraInfo) for cameraInfo in availableCameras)
+		return availableCameras
+
+	def rescanCameras(self):
+		previous = self.cameras
+		self.scanCameras()
+
+		for deviceName in sorted(previous):
+			if deviceName not in self.cameras:
+				self.cameraRemoved.emit(deviceName)
+
+		for deviceName in sorted(self.cameras):
+			if deviceName not in previous:
+				self.cameraAdded.emit(self.cameras[deviceName])
+
+	# The first of deviceNames that's still plugged in, or None. Several cameras can go in one
+	# rescan, and the ones not reported yet are still in the menu but already gone from here.
+	def firstCamera(self, deviceNames):
+		for deviceName in sorted(deviceNames):
+			if deviceName in self.cameras:
+				return self.cameras[deviceName]
+
+		return None
+
+	# the printers as last found, so only changes after that get reported
+	def setPrinters(self, printerNames):
+		self.printers = set(printerNames)
+
+	def pollPrinters(self):
+		if self.printerCall is not None:
+			# whatever changed might have been missed by the poll that's running
+			self.printerPollAgain = True
+			return
+
+		self.printerCall = BackgroundCall(printerNames)
+		self.printerCall.done.connect(self._printersFound)
+		self.printerCall.finished.connect(self._printerPollFinished)
+		self.printerCall.start()
+
+	def _printerPollFinished(self):
+		self.printerCall = None
+		if self.printerPollAgain:
+			self.printerPollAgain = False
+			self.pollPrinters()
+
+	def _printersFound(self, names):
+		# a full refresh is still on its way, and will set the starting point
+		if self.printers is None:
+			return
+
+		# without lpstat Qt has to be asked, which is only safe here on the GUI thread
+		if names is None:
+			names = QtPrintSupport.QPrinterInfo.availablePrinterNames()
+		previous = self.printers
+		self.printers = set(names)
+
+		for name in sorted(previous):
+			if name not in self.printers:
+				self.printerRemoved.emit(name)
+
+		added = sorted(name for name in self.printers if name not in previous)
+		for printerInfo in printerInfos(added):
+			self.printerAdded.emit(printerInfo)
+
+# Cameras can't be deleted while they're still shutting down without crashing, so
+# retired cameras are kept here only until they've unloaded, then let go of.
+class CameraRetirement(QtCore.QObject):
+	def __init__(self, parent=None):
+		super().__init__(parent)
+		self.cameras = []
+
+	def retire(self, camera, imageCapture=None):
+		if imageCapture is not None:
+			imageCapture.deleteLater()
+
+		self.cameras.append(camera)
+		camera.statusChanged.connect(lambda status: self._statusChanged(camera, status))
+
+		camera.stop()
+		camera.setViewfinder(None)
+		camera.unload()
+		self._statusChanged(camera, camera.status())
+
+	def _statusChanged(self, camera, status):
+		# an unplugged camera goes straight to unavailable
+		if status in (QtMultimedia.QCamera.UnloadedStatus, QtMultimedia.QCamera.UnavailableStatus) and camera in self.cameras:
+			self.cameras.remove(camera)
+			camera.deleteLater()
+
+	def __len__(self):
+		return len(self.cameras)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from PyQt5 import QtCore
+
+import re
+import xml.etree.ElementTree as ET
+
+from template import SVG_NS, XLINK_HREF, UNITS_PER_INCH, lengthToInches, parseSVG
+
+PX_PER_INCH = UNITS_PER_INCH['px']
+
+# "8.5x11in" or "3.5inx2.25in"; a size without a unit on the first number uses the second's
+def parseSize(text):
+	match = re.match(r'^\s*([\d.]+)([a-z]*)\s*x\s*([\d.]+)([a-z]*)\s*$', text)
+	if match is None:
+		raise ValueError('Unsupported size: %s (expected something like 8.5x11in)' % text)
+
+	width, widthUnit, height, heightUnit = match.groups()
+	return (lengthToInches(width + (widthUnit or heightUnit)), lengthToInches(height + heightUnit))
+
+# "0.5in" for both directions, or "0.25in,0.5in" for left and top
+def parseMargins(text):
+	values = [lengthToInches(value) for value in text.split(',')]
+	if len(values) == 1:
+		return (values[0], values[0])
+	if len(values) == 2:
+		return tuple(values)
+
+	raise ValueError('Unsupported margins: %s' % text)
+
+# Where the badges go on a sheet of labels or cards. Sizes are in inches. Without a
+# label size each badge keeps its own size, and without margins the grid is centered.
+class SheetLayout(object):
+	def __init__(self, columns, rows, pageSize=(8.5, 11.0), labelSize=None, margins=None, gap=(0.0, 0.0)):
+		if columns < 1 or rows < 1:
+			raise ValueError('A sheet needs at least one row and one column')
+
+		self.columns = columns
+		self.rows = rows
+		self.pageSize = pageSize
+		self.labelSize = labelSize
+		self.margins = margins
+		self.gap = gap
+
+	# "2x5" is two columns and five rows
+	@staticmethod
+	def parse(grid, pageSize=None, labelSize=None, margins=None, gap=None):
+		match = re.match(r'^\s*(\d+)\s*x\s*(\d+)\s*$', grid)
+		if match is None:
+			raise ValueError('Unsupported sheet grid: %s (expected COLUMNSxROWS)' % grid)
+
+		return SheetLayout(
+			int(match.group(1)), int(match.group(2)),
+			parseSize(pageSize) if pageSize else (8.5, 11.0),
+			parseSize(labelSize) if labelSize else None,
+			parseMargins(margins) if margins else None,
+			parseMargins(gap) if gap else (0.0, 0.0),
+		)
+
+	# --sheet 2x5 [--sheet-page 8.5x11in] [--sheet-label 3.5x2in] [--sheet-margins 0.5in] [--sheet-gap 0.125in]
+	@staticmethod
+	def fromArgs(args):
+		if '--sheet' not in args:
+			return None
+
+		def option(name):
+			return args[1+args.index(name)] if name in args else None
+
+		return SheetLayout.parse(
+			option('--sheet'), option('--sheet-page'), option('--sheet-label'),
+			option('--sheet-margins'), option('--sheet-gap')
+		)
+
+	@property
+	def capacity(self):
+		return self.columns * self.rows
+
+	# top left corner of a badge's cell, filling the sheet a row at a time
+	def cellOrigin(self, index, labelSize):
+		row, column = divmod(index, self.columns)
+		if self.margins is not None:
+			left, top = self.margins
+		else:
+			left = (self.pageSize[0] - self.columns * labelSize[0] - (self.columns - 1) * self.gap[0]) / 2
+			top = (self.pageSize[1] - self.rows * labelSize[1] - (self.rows - 1) * self.gap[1]) / 2
+
+		return (
+			left + column * (labelSize[0] + self.gap[0]),
+			top + row * (labelSize[1] + self.gap[1]),
+		)
+
+	def fits(self, labelSize):
+		left, top = self.cellOrigin(0, labelSize)
+		right, bottom = self.cellOrigin(self.capacity - 1, labelSize)
+		# a little slack for rounding in the page and label sizes
+		return left > -0.01 and top > -0.01 and \
+			right + labelSize[0] < self.pageSize[0] + 0.01 and bottom + labelSize[1] < self.pageSize[1] + 0.01
+
+	def __str__(self):
+		return '%dx%d' % (self.columns, self.rows)
+
+_urlPattern = re.compile(r'url\(#([^)]+)\)')
+_cssIDPattern = re.compile(r'#(-?[A-Za-z_][\w-]*)')
+
+# Every badge on a sheet comes from the same template, so their ids (and the gradients
+# and clip paths they point at) would clash without a prefix of their own
+def _prefixIDs(root, prefix):
+	def prefixURL(match):
+		return 'url(#%s%s)' % (prefix, match.group(1))
+
+	for element in root.iter():
+		for name, value in element.attrib.items():
+			if name == 'id':
+				element.set(name, prefix + value)
+			elif name in (XLINK_HREF, 'href'):
+				if value.startswith('#'):
+					element.set(name, '#' + prefix + value[1:])
+			elif 'url(#' in value:
+				element.set(name, _urlPattern.sub(prefixURL, value))
+
+		if element.tag == '{%s}style' % SVG_NS and element.text:
+			# the text before each { is a selector, where #ids are; the text before a } is
+			# declarations, where a # is a colour
+			parts = re.split(r'([{}])', element.text)
+			for i in range(0, len(parts) - 1, 2):
+				if parts[i + 1] == '{' and not parts[i].lstrip().startswith('@'):
+					parts[i] = _cssIDPattern.sub(lambda match: '#' + prefix + match.group(1), parts[i])
+			element.text = _urlPattern.sub(prefixURL, ''.join(parts))
+
+def _badgeSize(root):
+	width = lengthToInches(root.get('width'))
+	height = lengthToInches(root.get('height'))
+	viewBox = root.get('viewBox')
+	if viewBox is not None:
+		viewBox = [float(value) for value in viewBox.replace(',', ' ').split()]
+	else:
+		viewBox = [0.0, 0.0, width * PX_PER_INCH, height * PX_PER_INCH]
+
+	return (width, height), viewBox
+
+# Lays out serialized badges on one page and returns the page as a serialized SVG
+def impose(badges, layout):
+	if len(badges) > layout.capacity:
+		raise ValueError('%d badges do not fit on a %s sheet' % (len(badges), layout))
+
+	pageWidth, pageHeight = layout.pageSize
+	page = ET.Element('{%s}svg' % SVG_NS, {
+		'width': '%gin' % pageWidth,
+		'height': '%gin' % pageHeight,
+		'viewBox': '0 0 %g %g' % (pageWidth * PX_PER_INCH, pageHeight * PX_PER_INCH),
+		'version': '1.1',
+	})
+
+	labelSize = layout.labelSize
+	for index, content in enumerate(badges):
+		root = parseSVG(content)
+		size, viewBox = _badgeSize(root)
+		if labelSize is None:
+			labelSize = size
+		if index == 0 and not layout.fits(labelSize):
+			raise ValueError('%s badges of %gx%gin do not fit on a %gx%gin page' % (layout, labelSize[0], labelSize[1], pageWidth, pageHeight))
+
+		# scale the badge into its cell, keeping its aspect ratio and centering it
+		scale = min(labelSize[0] * PX_PER_INCH / viewBox[2], labelSize[1] * PX_PER_INCH / viewBox[3])
+		x, y = layout.cellOrigin(index, labelSize)
+		x = x * PX_PER_INCH + (labelSize[0] * PX_PER_INCH - viewBox[2] * scale) / 2
+		y = y * PX_PER_INCH + (labelSize[1] * PX_PER_INCH - viewBox[3] * scale) / 2
+
+		_prefixIDs(root, 'badge%d-' % (index + 1))
+		group = ET.SubElement(page, '{%s}g' % SVG_NS, {
+			'id': 'badge%d' % (index + 1),
+			'transform': 'translate(%g,%g) scale(%g) translate(%g,%g)' % (x, y, scale, -viewBox[0], -viewBox[1]),
+		})
+		for child in root:
+			# editor state belongs to the page, not to each badge on it
+			if isinstance(child.tag, str) and child.tag.rsplit('}', 1)[-1] not in ('metadata', 'namedview'):
+				group.append(child)
+
+	return ('<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n' + ET.tostring(page, encoding='unicode')).encode('utf-8')
+
+# Holds on to Quick Print badges until a sheet is full, or until the first one has waited
+# timeout seconds, then hands them over as one sheet. A sheet only ever goes to one printer.
+class SheetCollector(QtCore.QObject):
+	sheetReady = QtCore.pyqtSignal(object, object)
+
+	def __init__(self, layout, timeout=30.0, parent=None):
+		super().__init__(parent)
+		self.layout = layout
+		self.printer = None
+		self.badges = []
+
+		self.timer = QtCore.QTimer(self)
+		self.timer.setSingleShot(True)
+		self.timer.setInterval(int(timeout * 1000))
+		self.timer.timeout.connect(self.flush)
+
+	def add(self, printer, name, content):
+		if len(self.badges) > 0 and printer is not self.printer:
+			self.flush()
+
+		self.printer = printer
+		self.badges.append((name, content))
+		if len(self.badges) >= self.layout.capacity:
+			self.flush()
+		elif len(self.badges) == 1:
+			self.timer.start()
+
+	def flush(self):
+		self.timer.stop()
+		if len(self.badges) == 0:
+			return
+
+		printer, badges = self.printer, self.badges
+		self.printer = None
+		self.badges = []
+		self.sheetReady.emit(printer, badges)
+
+	def __len__(self):
+		return len(self.badges)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import xml.etree.ElementTree as ET
+
+# What changes from badge to badge: the form fields and the image slots, plus anything
+# whose look can't be known without following a reference or laying out text
+DYNAMIC_TAGS = set(['text', 'flowRoot', 'image', 'use', 'foreignObject', 'switch'])
+
+# needed by every layer, since anything might refer to them
+SHARED_TAGS = set(['defs', 'style'])
+
+# not drawn at all
+SKIPPED_TAGS = set(['metadata', 'namedview', 'title', 'desc', 'script'])
+
+# a group with any of these is drawn as a whole, so it can't be split across layers
+_ATOMIC_ATTRIBUTES = ('opacity', 'filter', 'mask', 'clip-path')
+
+def _tag(element):
+	return element.tag.rsplit('}', 1)[-1] if isinstance(element.tag, str) else ''
+
+def _isDynamic(element):
+	return any(_tag(child) in DYNAMIC_TAGS for child in element.iter())
+
+def _isAtomic(element):
+	if _tag(element) not in ('g', 'a'):
+		return True
+
+	style = element.get('style', '')
+	return any(element.get(name) is not None or name + ':' in style for name in _ATOMIC_ATTRIBUTES)
+
+# Flattens the drawing into (ancestors, element, kind) in paint order, where kind is
+# 'static', 'dynamic' or 'shared'. Groups are only opened up when they hold something dynamic.
+def _units(element, ancestors=()):
+	for child in element:
+		tag = _tag(child)
+		if tag == '' or tag in SKIPPED_TAGS:
+			continue
+		elif tag in SHARED_TAGS:
+			yield ancestors, child, 'shared'
+		elif not _isDynamic(child):
+			yield ancestors, child, 'static'
+		elif _isAtomic(child):
+			yield ancestors, child, 'dynamic'
+		else:
+			for unit in _units(child, ancestors + (child,)):
+				yield unit
+
+# Splits a drawing into runs that, painted in order, look the same as the whole: returns
+# the shared units and a list of (static, units). Which units are static only depends on
+# the tags, so every badge made from a template is split the same way.
+def layerRuns(root):
+	shared = []
+	runs = []
+	for unit in _units(root):
+		if unit[2] == 'shared':
+			shared.append(unit)
+			continue
+
+		static = unit[2] == 'static'
+		if len(runs) == 0 or runs[-1][0] != static:
+			runs.append((static, []))
+		runs[-1][1].append(unit)
+
+	return shared, runs
+
+# a document with the root's page setup and just the given units, nested as they were
+def layerDocument(root, units):
+	document = ET.Element(root.tag, root.attrib)
+	copies = {}
+	for ancestors, element, kind in units:
+		parent = document
+		for ancestor in ancestors:
+			if ancestor not in copies:
+				copies[ancestor] = ET.SubElement(parent, ancestor.tag, ancestor.attrib)
+			parent = copies[ancestor]
+		parent.append(element)
+
+	return ('<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n' + ET.tostring(document, encoding='unicode')).encode('utf-8')
@@ -2,33 +2,103 @@
 # -*- coding: utf-8 -*-
 
 from PyQt5 import QtCore
-from functools import partial
-import urllib3
 
-import time
+import os, time
 from datetime import datetime
+import threading, sqlite3
 
 import json
 
+from tracing import tracer
+
+# Durable queue of entries waiting to be sent. Entries stay here until the server accepts them.
+class Outbox(object):
+	def __init__(self, filename):
+		self.lock = threading.Lock()
+		self.db = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+		self.db.execute('PRAGMA journal_mode=WAL')
+		self.db.execute('PRAGMA synchronous=NORMAL')
+		self.db.execute('CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY, data TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0)')
+		# how many of the attempts the server answered with anything but "ok"
+		if 'rejections' not in [column[1] for column in self.db.execute('PRAGMA table_info(outbox)')]:
+			self.db.execute('ALTER TABLE outbox ADD COLUMN rejections INTEGER NOT NULL DEFAULT 0')
+		# entries the server kept turning down, set aside so the rest can still go
+		self.db.execute('CREATE TABLE IF NOT EXISTS rejected (id INTEGER PRIMARY KEY, data TEXT NOT NULL, attempts INTEGER NOT NULL, reason TEXT)')
+
+	def put(self, data):
+		return self.putMany([data])
+
+	def putMany(self, entries):
+		rows = [(json.dumps(data, sort_keys=True),) for data in entries]
+		# all of the entries go in the outbox, or none do if one of them fails
+		with self.lock, self.db:
+			self.db.execute('BEGIN')
+			self.db.executemany('INSERT INTO outbox (data) VALUES (?)', rows)
+
+	def peek(self, limit):
+		with self.lock:
+			rows = self.db.execute('SELECT id, data, attempts, rejections FROM outbox ORDER BY id LIMIT ?', (limit,)).fetchall()
+		return [(id, json.loads(data), attempts, rejections) for id, data, attempts, rejections in rows]
+
+	def remove(self, id):
+		with self.lock:
+			self.db.execute('DELETE FROM outbox WHERE id = ?', (id,))
+
+	def failed(self, id):
+		with self.lock:
+			self.db.execute('UPDATE outbox SET attempts = attempts + 1 WHERE id = ?', (id,))
+
+	def rejectedOnce(self, id):
+		with self.lock:
+			self.db.execute('UPDATE outbox SET attempts = attempts + 1, rejections = rejections + 1 WHERE id = ?', (id,))
+
+	def reject(self, id, reason):
+		with self.lock, self.db:
+			self.db.execute('BEGIN')
+			self.db.execute(
+				'INSERT INTO rejected (id, data, attempts, reason) SELECT id, data, attempts + 1, ? FROM outbox WHERE id = ?',
+				(reason, id)
+			)
+			self.db.execute('DELETE FROM outbox WHERE id = ?', (id,))
+
+	def __len__(self):
+		with self.lock:
+			return self.db.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+	def close(self):
+		with self.lock:
+			self.db.close()
+
 class WebFormLogger(QtCore.QObject):
 	logComplete = QtCore.pyqtSignal(object, object)
 	fallbackError = QtCore.pyqtSignal(object)
 
-	def __init__(self, url, fallbackFile=None, parent=None):
+	def __init__(self, url, fallbackFile=None, outboxFile=None, parent=None):
 		super().__init__(parent)
-		self.threads = []
 		self.url = url
 		self.fallbackFile = fallbackFile
 
-	def threadFinished(self, worker):
-		self.threads.remove(worker)
-		if worker.submissionState == 'ok':
-			self.logComplete.emit(True, None)
-		else:
-			self.logComplete.emit(False, worker.error)
-			
-			if worker.fallbackError is not None:
-				self.fallbackError.emit(worker.fallbackError)
+		if outboxFile is None:
+			outboxFile = os.path.join(os.path.dirname(fallbackFile or ''), 'outbox.sqlite3')
+		self.outbox = Outbox(outboxFile)
+		self._replayFallbackFile()
+
+		self.worker = WebWorkerThread(self.url, self.outbox)
+		self.worker.entrySent.connect(self.logComplete)
+		self.worker.start()
+
+	# entries that older versions could not send were only appended to the fallback file
+	def _replayFallbackFile(self):
+		if self.fallbackFile is None or not os.path.isfile(self.fallbackFile):
+			return
+
+		try:
+			with open(self.fallbackFile) as logFile:
+				entries = [json.loads(line) for line in logFile if line.strip() != '']
+			self.outbox.putMany(entries)
+			os.remove(self.fallbackFile)
+		except Exception as exc:
+			print('Failed to replay %s: %s' % (self.fallbackFile, exc))
 
 	def logEntry(self, data):
 		currentTime = int(time.time())
@@ -36,41 +106,116 @@ class WebFormLogger(QtCore.QObject):
 			data['timestamp'] = currentTime
 			data['hr-timestamp'] = datetime.fromtimestamp(currentTime).strftime('%Y-%m-%d %H:%M:%S')
 
-		thread = WebWorkerThread(self.url, data, self.fallbackFile)
-		self.threads.append(thread)
-		thread.finished.connect(partial(self.threadFinished, thread))
-		thread.start()
+		try:
+			self.outbox.put(data)
+		except Exception as exc:
+			self.logComplete.emit(False, 'Exception: %s' % exc)
+			try:
+				with open(self.fallbackFile, 'a') as logFile:
+					logFile.write(json.dumps(data, sort_keys=True) + '\n')
+			except Exception as exc:
+				print('Failed to write to fallback log!')
+				self.fallbackError.emit(exc)
+			return
+
+		self.worker.wake()
+
+	# long enough for a send that's under way to time out (see WebWorkerThread.TIMEOUT)
+	def shutdown(self, timeout=10.0):
+		self.worker.stop()
+		self.worker.wait(int(timeout * 1000))
+		# a worker that's still going would be left writing to a closed database
+		if self.worker.isFinished():
+			self.outbox.close()
 
+# The server took the request (a 2xx), but didn't answer "ok", so it's the entry that's the
+# problem rather than the connection or the server
+class SubmissionRejected(Exception):
+	pass
+
+# An entry the server turns down maxRejections times is moved out of the way, so it doesn't
+# hold up the rest. Anything else that goes wrong, error statuses included, leaves the entry
+# at the front of the queue. Either way the next try waits a while longer each time.
 class WebWorkerThread(QtCore.QThread):
-	def __init__(self, url, data, fallbackFile=None):
+	entrySent = QtCore.pyqtSignal(object, object)
+
+	# (connect, read) in seconds
+	TIMEOUT = (2.0, 5.0)
+
+	def __init__(self, url, outbox, batchSize=20, minBackoff=1.0, maxBackoff=300.0, maxRejections=3):
 		super().__init__()
 		self.url = url
-		self.data = data
-		self.fallbackFile = fallbackFile
-		self.submissionState = None
-		self.error = None
-		self.fallbackError = None
+		self.outbox = outbox
+		self.batchSize = batchSize
+		self.maxRejections = maxRejections
+		self.minBackoff = minBackoff
+		self.maxBackoff = maxBackoff
+		self.backoff = 0
+		self.wakeEvent = threading.Event()
+		self.stopEvent = threading.Event()
+		self.http = None
+
+	def wake(self):
+		self.wakeEvent.set()
+
+	def stop(self):
+		self.stopEvent.set()
+		self.wakeEvent.set()
+
+	@tracer.traced('log send')
+	def send(self, data):
+		request = self.http.request('GET', self.url, fields=data)
+		if request.status < 200 or request.status >= 300:
+			raise Exception('HTTP %d' % request.status)
+
+		response = request.data.decode('utf-8')
+		if response != 'ok':
+			print(response)
+			raise SubmissionRejected('Unknown submission error')
 
 	def run(self):
-		self.submissionState = 'sending'
-		try:
-			http = urllib3.PoolManager()
-			request = http.request('GET', self.url, fields=self.data, timeout=1.0, retries=0)
+		# urllib3 is slow to import, so that happens here instead of while the app starts up
+		import urllib3
 
-			response = request.data.decode('utf-8')
-			if response == 'ok':
-				self.submissionState = 'ok'
-			else:
-				print(response)
-				raise Exception('Unknown submission error')
+		# one pool for the life of the logger, so connections are reused between entries
+		self.http = urllib3.PoolManager(maxsize=1, timeout=urllib3.Timeout(connect=self.TIMEOUT[0], read=self.TIMEOUT[1]), retries=False)
 
-		except Exception as exc:
-			self.submissionState = 'fail'
-			self.error = 'Exception: %s' % exc
+		while not self.stopEvent.is_set():
+			self.wakeEvent.clear()
+			failed = False
+			for id, data, attempts, rejections in self.outbox.peek(self.batchSize):
+				if self.stopEvent.is_set():
+					break
 
-			try:
-				with open(self.fallbackFile, 'a') as logFile:
-					logFile.write(json.dumps(self.data, sort_keys=True) + '\n')
-			except Exception as exc:
-				print('Failed to write to fallback log!')
-				self.fallbackError = exc
+				try:
+					self.send(data)
+				except SubmissionRejected as exc:
+					if rejections + 1 >= self.maxRejections:
+						self.outbox.reject(id, str(exc))
+						self.entrySent.emit(False, 'Exception: %s (gave up after %d tries)' % (exc, rejections + 1))
+					else:
+						self.outbox.rejectedOnce(id)
+						if attempts == 0:
+							self.entrySent.emit(False, 'Exception: %s (will retry)' % exc)
+						failed = True
+					continue
+				except Exception as exc:
+					self.outbox.failed(id)
+					# report each entry's first failure only, retries happen quietly
+					if attempts == 0:
+						self.entrySent.emit(False, 'Exception: %s (will retry)' % exc)
+					failed = True
+					break
+
+				self.outbox.remove(id)
+				self.entrySent.emit(True, None)
+
+			if failed:
+				# new entries don't cut the backoff short, only shutting down does
+				self.backoff = min(self.maxBackoff, max(self.minBackoff, self.backoff * 2))
+				self.stopEvent.wait(self.backoff)
+			elif len(self.outbox) > 0:
+				self.backoff = 0
+			else:
+				self.backoff = 0
+				self.wakeEvent.wait()
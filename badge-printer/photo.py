@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from PyQt5 import QtCore, QtGui
+
+import os, threading
+
+PRINT_DPI = 300
+JPEG_QUALITY = 90
+
+cv2 = None
+numpy = None
+_openCVLoaded = False
+_openCVLock = threading.Lock()
+_faceCascade = None
+
+# Face centering is optional. OpenCV 4 ships its Haar cascades inside the package,
+# so detection works offline without downloading any models.
+# It takes a while to import, so that only happens the first time it's needed.
+def _loadOpenCV():
+	global cv2, numpy, _openCVLoaded
+	with _openCVLock:
+		if not _openCVLoaded:
+			_openCVLoaded = True
+			try:
+				import cv2 as _cv2
+				import numpy as _numpy
+
+				# OpenCV 5 moved the Haar cascades out of the main package
+				if hasattr(_cv2, 'CascadeClassifier'):
+					cv2, numpy = _cv2, _numpy
+			except ImportError:
+				pass
+
+	return cv2 is not None
+
+def faceDetectionAvailable():
+	return _loadOpenCV()
+
+def findFace(image):
+	global _faceCascade
+	if not _loadOpenCV():
+		return None
+
+	if _faceCascade is None:
+		_faceCascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+	# detect on a small grayscale copy, it's plenty for finding a face and much faster
+	scale = min(1.0, 320.0 / max(image.width(), image.height()))
+	small = image.scaled(
+		int(image.width() * scale), int(image.height() * scale),
+		QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.FastTransformation
+	).convertToFormat(QtGui.QImage.Format_Grayscale8)
+
+	pointer = small.constBits()
+	pointer.setsize(small.bytesPerLine() * small.height())
+	pixels = numpy.frombuffer(pointer, numpy.uint8).reshape(small.height(), small.bytesPerLine())[:, :small.width()]
+
+	faces = _faceCascade.detectMultiScale(pixels, scaleFactor=1.1, minNeighbors=5)
+	if len(faces) == 0:
+		return None
+
+	# the biggest face is the one posing for the badge
+	x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+	return QtCore.QRectF(x / scale, y / scale, w / scale, h / scale)
+
+def cropRect(imageSize, aspectRatio, face=None):
+	width, height = imageSize.width(), imageSize.height()
+	if width / height > aspectRatio:
+		cropWidth, cropHeight = height * aspectRatio, height
+	else:
+		cropWidth, cropHeight = width, width / aspectRatio
+
+	# like xMidYMid slice, unless there's a face to center on
+	centerX, centerY = width / 2, height / 2
+	if face is not None:
+		centerX = face.center().x()
+		# leave a little more room above the head than below the chin
+		centerY = face.center().y() + face.height() * 0.15
+
+	left = min(max(0, centerX - cropWidth / 2), width - cropWidth)
+	top = min(max(0, centerY - cropHeight / 2), height - cropHeight)
+	return QtCore.QRect(int(left), int(top), int(cropWidth), int(cropHeight))
+
+# 'jpeg' or 'png', from a photo's file extension
+def imageTypeForFilename(filename):
+	extension = os.path.splitext(filename)[1].lower()
+	return 'png' if extension == '.png' else 'jpeg'
+
+# Decodes a photo the right way up. Phones often save photos sideways with an EXIF
+# orientation tag, which is lost when the photo is re-encoded.
+def decodeImage(data):
+	buffer = QtCore.QBuffer()
+	buffer.setData(data)
+	buffer.open(QtCore.QIODevice.ReadOnly)
+	reader = QtGui.QImageReader(buffer)
+	reader.setAutoTransform(True)
+	return reader.read()
+
+# Crops a photo to the aspect ratio of its box and scales it down to the print resolution.
+# Returns (data, imageType): JPEG, or PNG for a photo with transparency.
+def preparePhoto(data, imageType, boxSize, dpi=PRINT_DPI, centerOnFace=False):
+	image = decodeImage(data)
+	if image.isNull():
+		return data, imageType
+
+	boxWidth, boxHeight = boxSize
+	face = findFace(image) if centerOnFace else None
+	image = image.copy(cropRect(image.size(), boxWidth / boxHeight, face))
+
+	targetWidth, targetHeight = int(round(boxWidth * dpi)), int(round(boxHeight * dpi))
+	if image.width() > targetWidth or image.height() > targetHeight:
+		image = image.scaled(targetWidth, targetHeight, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+
+	buffer = QtCore.QBuffer()
+	buffer.open(QtCore.QIODevice.WriteOnly)
+	# JPEG would fill in the background of a cut-out, so those stay PNG
+	if image.hasAlphaChannel():
+		image.save(buffer, 'PNG')
+		return bytes(buffer.data()), 'png'
+
+	image.save(buffer, 'JPG', JPEG_QUALITY)
+	return bytes(buffer.data()), 'jpeg'
@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from PyQt5 import QtCore, QtPrintSupport
+
+import os, subprocess, time
+import queue, itertools, threading
+
+from renderer import RENDERERS, DEFAULT_RENDERER
+from tracing import tracer
+
+class PrintError(Exception):
+	pass
+
+class PrintJob(object):
+	_ids = itertools.count(1)
+
+	# content is the SVG to render, or None when spool already holds rendered output.
+	# With a pool, printerName is filled in once a printer has taken the job.
+	# prepare, if set, makes the content on the worker thread, for content that's slow to build.
+	# layers is the content split up by BadgeTemplate.layers(), for renderers that can use it.
+	def __init__(self, name, content, printerName, renderer=DEFAULT_RENDERER, spool=None, pool=None):
+		self.id = next(PrintJob._ids)
+		self.name = name
+		self.content = content
+		self.printerName = printerName
+		self.pool = pool
+		self.renderer = renderer
+		self.spool = spool
+		self.prepare = None
+		self.layers = None
+		self.cached = False
+		self.archiveID = None
+		self.started = time.perf_counter()
+		self.state = 'queued'
+		self.error = None
+
+	def __str__(self):
+		return '#%d %s' % (self.id, self.name)
+
+def spool(printerName, data):
+	process = subprocess.Popen(
+		['lpr', '-P', printerName],
+		stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+	)
+	output = process.communicate(data)[0].decode('utf-8', 'replace').strip()
+	if process.returncode != 0:
+		raise PrintError('lpr exited with %d. %s' % (process.returncode, output))
+
+# The names of the CUPS queues, or None without lpstat. Safe to call from any thread,
+# unlike QPrinterInfo, so this is what's used to look for printers in the background.
+def printerNames():
+	try:
+		result = subprocess.run(
+			['lpstat', '-e'],
+			stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=10,
+			env=dict(os.environ, LC_ALL='C')
+		)
+	except (OSError, subprocess.TimeoutExpired):
+		return None
+
+	if result.returncode != 0:
+		return None
+
+	return [line.strip() for line in result.stdout.decode('utf-8', 'replace').splitlines() if line.strip() != '']
+
+# QPrinterInfo for each name, on the GUI thread. Without a list from lpstat Qt is asked instead.
+def printerInfos(names):
+	if names is None:
+		names = QtPrintSupport.QPrinterInfo.availablePrinterNames()
+
+	# a queue that's gone again by now comes back as a null QPrinterInfo
+	printerInfos = [QtPrintSupport.QPrinterInfo.printerInfo(name) for name in names]
+	return [printerInfo for printerInfo in printerInfos if not printerInfo.isNull()]
+
+# (accepting jobs, jobs waiting) for a CUPS queue
+def printerStatus(printerName):
+	try:
+		output = subprocess.run(
+			['lpstat', '-p', printerName, '-o', printerName],
+			stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=5,
+			env=dict(os.environ, LC_ALL='C') # the output is parsed, so it mustn't be translated
+		).stdout.decode('utf-8', 'replace')
+	except (OSError, subprocess.TimeoutExpired):
+		return True, 0
+
+	enabled = True
+	jobs = 0
+	for line in output.splitlines():
+		if line.startswith('printer %s ' % printerName):
+			enabled = ' disabled' not in line
+		elif line.startswith('%s-' % printerName):
+			jobs += 1
+
+	return enabled, jobs
+
+# Several printers used as one: each job goes to the printer with the shortest queue,
+# and a printer that refuses a job is skipped for a while in favour of the others.
+class PrinterPool(object):
+	def __init__(self, printerNames, retryAfter=60.0):
+		self.printerNames = list(printerNames)
+		self.retryAfter = retryAfter
+		self.lock = threading.Lock()
+		self.spooling = dict((name, 0) for name in self.printerNames)
+		self.failedUntil = {}
+
+	def __str__(self):
+		return ' + '.join(self.printerNames)
+
+	def choose(self, exclude=()):
+		now = time.time()
+		candidates = [name for name in self.printerNames if name not in exclude]
+		healthy = [name for name in candidates if self.failedUntil.get(name, 0) <= now]
+
+		best = None
+		for name in healthy or candidates:
+			enabled, jobs = printerStatus(name)
+			with self.lock:
+				jobs += self.spooling[name]
+			# a disabled CUPS queue still takes jobs, it just never prints them
+			score = (not enabled, jobs)
+			if best is None or score < best[0]:
+				best = (score, name)
+
+		return best[1] if best is not None else None
+
+	def spool(self, job):
+		errors = []
+		tried = set()
+		while True:
+			printerName = self.choose(tried)
+			if printerName is None:
+				raise PrintError('No printer took the job. %s' % ' '.join(errors))
+			tried.add(printerName)
+
+			with self.lock:
+				self.spooling[printerName] += 1
+			try:
+				spool(printerName, job.spool)
+			except PrintError as exc:
+				errors.append('%s: %s' % (printerName, exc))
+				with self.lock:
+					self.failedUntil[printerName] = time.time() + self.retryAfter
+				continue
+			finally:
+				with self.lock:
+					self.spooling[printerName] -= 1
+
+			with self.lock:
+				self.failedUntil.pop(printerName, None)
+			job.printerName = printerName
+			return printerName
+
+class PrintWorkerThread(QtCore.QThread):
+	progress = QtCore.pyqtSignal(object, object)
+	done = QtCore.pyqtSignal(object, object, object)
+
+	def __init__(self, jobs, defaultRenderer, cache=None):
+		super().__init__()
+		self.jobs = jobs
+		self.defaultRenderer = defaultRenderer
+		self.cache = cache
+		self.renderers = {}
+
+	# each worker owns its renderers, so several workers make a pool of warm renderers
+	def renderer(self, name):
+		if name not in self.renderers:
+			renderer = RENDERERS[name]()
+			self.renderers[name] = renderer
+			try:
+				renderer.start()
+			except Exception as exc:
+				print('Failed to start %s renderer: %s' % (name, exc))
+
+		return self.renderers[name]
+
+	def run(self):
+		self.renderer(self.defaultRenderer)
+
+		while True:
+			job = self.jobs.get()
+			if job is None:
+				break
+
+			try:
+				self.process(job)
+				job.state = 'done'
+				self.done.emit(job, True, None)
+			except Exception as exc:
+				job.state = 'failed'
+				job.error = exc
+				self.done.emit(job, False, exc)
+
+		for renderer in self.renderers.values():
+			renderer.close()
+
+	def process(self, job):
+		if job.content is None and job.prepare is not None:
+			with tracer.span('prepare', job=job.id):
+				job.content = job.prepare()
+
+		if job.spool is None and self.cache is not None:
+			key = self.cache.key(job.content, job.renderer)
+			with tracer.span('render cache', job=job.id):
+				job.spool = self.cache.reserve(key)
+			job.cached = job.spool is not None
+			if job.spool is None:
+				try:
+					self.render(job)
+					try:
+						self.cache.put(key, job.spool)
+					except OSError as exc:
+						print('Failed to cache rendered %s: %s' % (job, exc))
+				finally:
+					self.cache.release(key)
+
+		elif job.spool is None:
+			self.render(job)
+
+		job.state = 'spooling'
+		self.progress.emit(job, 'print')
+		if job.pool is not None:
+			with tracer.span('lpr', job=job.id, printer=str(job.pool)):
+				job.pool.spool(job)
+		else:
+			with tracer.span('lpr', job=job.id, printer=job.printerName):
+				spool(job.printerName, job.spool)
+
+	def render(self, job):
+		job.state = 'rendering'
+		self.progress.emit(job, 'render')
+		with tracer.span('render', job=job.id, renderer=job.renderer):
+			job.spool = self.renderer(job.renderer).render(job.content, job.layers)
+
+# Renders the badge being typed while the form sits idle, so that by the time Enter is
+# pressed the render cache already holds it and the print job only has to be spooled.
+# Only the latest request counts: newer ones replace it and cancel() drops it.
+class SpeculativeRenderThread(QtCore.QThread):
+	rendered = QtCore.pyqtSignal(object)
+
+	def __init__(self, cache, parent=None):
+		super().__init__(parent)
+		self.cache = cache
+		self.condition = threading.Condition()
+		self.pending = None
+		self.wanted = None
+		self.current = None
+		self.claimed = set()
+		self.stopping = False
+		self.renderers = {}
+
+	def speculate(self, content, renderer, layers=None):
+		key = self.cache.key(content, renderer)
+		with self.condition:
+			self.pending = (key, content, renderer, layers)
+			self.wanted = key
+			self.condition.notify()
+
+		return key
+
+	def speculating(self):
+		with self.condition:
+			return self.wanted is not None
+
+	# what's typed has changed, so whatever was being rendered is no use any more.
+	# With the key of the document as it is now, a render of that same document is kept.
+	def cancel(self, key=None):
+		with self.condition:
+			if key is not None and key == self.wanted:
+				return
+			self.pending = None
+			self.wanted = None
+
+	# a print job needs this key, so keep its render even if it gets cancelled
+	def claim(self, key):
+		with self.condition:
+			if key in (self.wanted, self.current):
+				self.claimed.add(key)
+
+	def shutdown(self):
+		with self.condition:
+			self.pending = None
+			self.stopping = True
+			self.condition.notify()
+		self.wait()
+
+	def run(self):
+		while True:
+			with self.condition:
+				while self.pending is None and not self.stopping:
+					self.condition.wait()
+				if self.stopping:
+					break
+				key, content, rendererName, layers = self.pending
+				self.pending = None
+				self.current = key
+
+			try:
+				self.process(key, content, rendererName, layers)
+			except Exception as exc:
+				# the print job will render it again and report the problem properly
+				print('Speculative render failed: %s' % exc)
+			finally:
+				with self.condition:
+					self.claimed.discard(key)
+					self.current = None
+
+		for renderer in self.renderers.values():
+			renderer.close()
+
+	def process(self, key, content, rendererName, layers=None):
+		if self.cache.reserve(key) is not None:
+			return # already rendered
+
+		try:
+			if rendererName not in self.renderers:
+				self.renderers[rendererName] = RENDERERS[rendererName]()
+				self.renderers[rendererName].start()
+
+			with tracer.span('speculative render', renderer=rendererName):
+				data = self.renderers[rendererName].render(content, layers)
+
+			with self.condition:
+				keep = key == self.wanted or key in self.claimed
+			if keep:
+				self.cache.put(key, data)
+		finally:
+			self.cache.release(key)
+
+		if keep:
+			self.rendered.emit(key)
+
+class PrintQueue(QtCore.QObject):
+	jobQueued = QtCore.pyqtSignal(object)
+	jobProgress = QtCore.pyqtSignal(object, object)
+	jobFinished = QtCore.pyqtSignal(object, object, object)
+
+	# workers share the cache, so a badge rendered by one is never rendered again by another
+	def __init__(self, workers=1, defaultRenderer=DEFAULT_RENDERER, cache=None, parent=None):
+		super().__init__(parent)
+		self.jobs = queue.Queue()
+		self.pendingJobs = []
+		self.threads = []
+		self.cache = cache
+
+		for i in range(max(1, workers)):
+			thread = PrintWorkerThread(self.jobs, defaultRenderer, cache)
+			thread.progress.connect(self.jobProgress)
+			thread.done.connect(self._jobDone)
+			thread.start()
+			self.threads.append(thread)
+
+	def _jobDone(self, job, ok, error):
+		if job in self.pendingJobs:
+			self.pendingJobs.remove(job)
+		self.jobFinished.emit(job, ok, error)
+
+	def submit(self, job):
+		self.pendingJobs.append(job)
+		self.jobs.put(job)
+		self.jobQueued.emit(job)
+		return job
+
+	def pending(self):
+		return len(self.pendingJobs)
+
+	# lets queued jobs finish, then stops the workers
+	def shutdown(self):
+		for thread in self.threads:
+			self.jobs.put(None)
+		for thread in self.threads:
+			thread.wait()
+		self.threads = []
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import struct, zlib
+from functools import lru_cache
+from urllib.parse import quote
+
+import pyqrcode
+
+def profileURL(name):
+	if name == '':
+		return 'http://makeict.org/'
+	else:
+		return 'http://makeict.org/wiki/User:%s' % quote(name, safe='')
+
+# Building the module matrix is the expensive part of pyqrcode, and the
+# same few URLs come back constantly, so both the matrix and the encoded
+# image are kept around.
+@lru_cache(maxsize=256)
+def qrMatrix(text):
+	return tuple(tuple(row) for row in pyqrcode.create(text).code)
+
+def _pngChunk(chunkType, data):
+	chunk = chunkType + data
+	return struct.pack('>I', len(data)) + chunk + struct.pack('>I', zlib.crc32(chunk) & 0xffffffff)
+
+# Writes a 1-bit grayscale PNG straight into a byte string, without going through pypng
+def encodePNG(matrix, scale=10):
+	size = len(matrix) * scale
+	rowBytes = (size + 7) // 8
+	padding = rowBytes * 8 - size
+
+	scanlines = []
+	for row in matrix:
+		# dark modules are 1 in the matrix, but black is 0 in a grayscale PNG
+		bits = 0
+		for module in row:
+			bits = (bits << scale) | (0 if module else (1 << scale) - 1)
+		bits <<= padding
+		scanline = b'\x00' + bits.to_bytes(rowBytes, 'big')
+		scanlines.append(scanline * scale)
+
+	return b''.join([
+		b'\x89PNG\r\n\x1a\n',
+		_pngChunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 1, 0, 0, 0, 0)),
+		_pngChunk(b'IDAT', zlib.compress(b''.join(scanlines), 9)),
+		_pngChunk(b'IEND', b''),
+	])
+
+@lru_cache(maxsize=256)
+def makeQR(text, scale=10):
+	return encodePNG(qrMatrix(text), scale)
+
+if __name__ == '__main__':
+	# python3 badge-printer/qr.py - how long each step takes per QR code
+	import io, timeit
+
+	texts = [profileURL('Member_%d' % i) for i in range(50)]
+
+	def pypngPath():
+		for text in texts:
+			pyqrcode.create(text).png(io.BytesIO(), scale=10, quiet_zone=0)
+
+	def matrixOnly():
+		qrMatrix.cache_clear()
+		for text in texts:
+			qrMatrix(text)
+
+	matrices = [qrMatrix(text) for text in texts]
+	def encodeOnly():
+		for matrix in matrices:
+			encodePNG(matrix, 10)
+
+	def cached():
+		for text in texts:
+			makeQR(text)
+
+	for label, function, repeat in [
+		('pyqrcode + pypng (before)', pypngPath, 1),
+		('matrix (uncached)', matrixOnly, 1),
+		('PNG encode (direct)', encodeOnly, 5),
+		('makeQR (cache hit)', cached, 100),
+	]:
+		elapsed = min(timeit.repeat(function, number=repeat, repeat=3)) / repeat
+		print('%-28s %8.3f ms per QR' % (label, 1000 * elapsed / len(texts)))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, hashlib, threading
+from collections import OrderedDict
+
+from assets import writeAtomically
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# Rendered spool files, keyed by the SVG that was rendered and the renderer that rendered it.
+# Least recently used files are dropped once the cache grows past maxSize bytes.
+class RenderCache(object):
+	def __init__(self, directory, maxSize=DEFAULT_MAX_SIZE):
+		self.directory = directory
+		self.maxSize = maxSize
+		self.lock = threading.Lock()
+		self.entries = OrderedDict()
+		self.rendering = {}
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+
+		os.makedirs(directory, exist_ok=True)
+
+		# the modification time is bumped on every hit, so it gives the order they were used in
+		found = []
+		for filename in os.listdir(directory):
+			path = os.path.join(directory, filename)
+			if len(filename) == 64 and os.path.isfile(path):
+				stat = os.stat(path)
+				found.append((stat.st_mtime_ns, filename, stat.st_size))
+			elif filename.startswith('tmp'):
+				os.remove(path) # left behind by a crash while writing
+
+		for mtime, key, size in sorted(found):
+			self.entries[key] = size
+			self.size += size
+
+		with self.lock:
+			self._evict()
+
+	@staticmethod
+	def key(content, renderer):
+		digest = hashlib.sha256(renderer.encode('utf-8') + b'\0')
+		digest.update(content)
+		return digest.hexdigest()
+
+	def _path(self, key):
+		return os.path.join(self.directory, key)
+
+	def get(self, key):
+		with self.lock:
+			if key not in self.entries:
+				self.misses += 1
+				return None
+
+			try:
+				with open(self._path(key), 'rb') as cacheFile:
+					data = cacheFile.read()
+				os.utime(self._path(key))
+			except OSError:
+				self.size -= self.entries.pop(key)
+				self.misses += 1
+				return None
+
+			self.entries.move_to_end(key)
+			self.hits += 1
+			return data
+
+	# Like get(), but a miss reserves the key: the caller renders it and then calls release().
+	# Anyone else asking for the same key meanwhile waits for that render instead of repeating it.
+	def reserve(self, key):
+		while True:
+			data = self.get(key)
+			if data is not None:
+				return data
+
+			with self.lock:
+				rendered = self.rendering.get(key)
+				if rendered is None:
+					self.rendering[key] = threading.Event()
+					return None
+			rendered.wait()
+
+	def release(self, key):
+		with self.lock:
+			rendered = self.rendering.pop(key, None)
+		if rendered is not None:
+			rendered.set()
+
+	def put(self, key, data):
+		if len(data) > self.maxSize:
+			return
+
+		writeAtomically(self._path(key), data)
+
+		with self.lock:
+			self.size += len(data) - self.entries.pop(key, 0)
+			self.entries[key] = len(data)
+			self._evict()
+
+	def _evict(self):
+		while self.size > self.maxSize and len(self.entries) > 0:
+			key, size = self.entries.popitem(last=False)
+			self.size -= size
+			try:
+				os.remove(self._path(key))
+			except OSError:
+				pass
+
+	def __len__(self):
+		return len(self.entries)
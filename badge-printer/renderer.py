@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from PyQt5 import QtCore, QtGui, QtSvg
+
+import os, re, subprocess, tempfile
+import select, time, hashlib
+from collections import OrderedDict
+
+from template import lengthToInches
+
+class RenderError(Exception):
+	pass
+
+def _inkscapeVersion():
+	try:
+		output = subprocess.check_output(['inkscape', '--version'], stderr=subprocess.DEVNULL)
+		match = re.search(rb'Inkscape (\d+)\.(\d+)', output)
+		if match:
+			return (int(match.group(1)), int(match.group(2)))
+	except Exception:
+		pass
+
+	return (0, 92)
+
+# Renderers turn a serialized SVG badge into data that can be handed to lpr. They may also
+# be given the badge split into layers by BadgeTemplate.layers(), which only some make use of.
+class InkscapeRenderer(object):
+	name = 'inkscape'
+	description = 'Inkscape'
+	usesLayers = False
+
+	def start(self):
+		pass
+
+	def close(self):
+		pass
+
+	def render(self, content, layers=None):
+		svgFile, svgFilename = tempfile.mkstemp('.svg')
+		psFile, psFilename = tempfile.mkstemp('.ps')
+		os.close(psFile)
+		try:
+			with os.fdopen(svgFile, 'wb') as svg:
+				svg.write(content)
+
+			self._renderFile(svgFilename, psFilename)
+
+			with open(psFilename, 'rb') as ps:
+				data = ps.read()
+			if len(data) == 0:
+				raise RenderError('Inkscape produced no output')
+
+			return data
+		finally:
+			os.unlink(svgFilename)
+			os.unlink(psFilename)
+
+	def _renderFile(self, svgFilename, psFilename):
+		process = subprocess.Popen(
+			['inkscape', '-P', psFilename, svgFilename],
+			stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+		)
+		output = process.communicate()[0].decode('utf-8', 'replace').strip()
+		if process.returncode != 0:
+			raise RenderError('inkscape exited with %d. %s' % (process.returncode, output))
+
+# Keeps one "inkscape --shell" process warm and feeds it a command per badge,
+# which avoids paying Inkscape's startup time for every print.
+class InkscapeShellRenderer(InkscapeRenderer):
+	name = 'inkscape-shell'
+	description = 'Inkscape (kept running)'
+
+	def __init__(self, timeout=60):
+		self.timeout = timeout
+		self.process = None
+		self.version = None
+
+	def start(self):
+		if self.process is not None and self.process.poll() is None:
+			return
+
+		self.close()
+		if self.version is None:
+			self.version = _inkscapeVersion()
+
+		self.process = subprocess.Popen(
+			['inkscape', '--shell'],
+			stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+		)
+		self._waitForPrompt()
+
+	def close(self):
+		if self.process is None:
+			return
+
+		process = self.process
+		self.process = None
+		try:
+			if process.poll() is None:
+				process.stdin.write(b'quit\n')
+				process.stdin.flush()
+				process.wait(5)
+		except Exception:
+			process.kill()
+			process.wait()
+
+	def _waitForPrompt(self):
+		output = b''
+		deadline = time.time() + self.timeout
+		stdout = self.process.stdout.fileno()
+		while not output.rstrip().endswith(b'>'):
+			remaining = deadline - time.time()
+			if remaining <= 0:
+				raise RenderError('Timed out waiting for the Inkscape shell')
+
+			ready = select.select([stdout], [], [], remaining)[0]
+			if ready:
+				chunk = os.read(stdout, 4096)
+				if chunk == b'':
+					raise RenderError('The Inkscape shell exited unexpectedly')
+				output += chunk
+
+		return output
+
+	def _command(self, svgFilename, psFilename):
+		if self.version >= (1, 0):
+			return 'file-open:%s; export-filename:%s; export-do; file-close\n' % (svgFilename, psFilename)
+		else:
+			return '%s --export-ps=%s\n' % (svgFilename, psFilename)
+
+	def _renderFile(self, svgFilename, psFilename):
+		# a crashed or wedged shell gets one restart before we give up on it
+		for attempt in range(2):
+			try:
+				self.start()
+				self.process.stdin.write(self._command(svgFilename, psFilename).encode('utf-8'))
+				self.process.stdin.flush()
+				self._waitForPrompt()
+				return
+			except Exception as exc:
+				error = exc
+				if self.process is not None:
+					self.process.kill()
+					self.process.wait()
+					self.process = None
+
+		# shell mode is unusable, fall back to launching Inkscape for this badge
+		try:
+			super()._renderFile(svgFilename, psFilename)
+		except RenderError as exc:
+			raise RenderError('%s (shell: %s)' % (exc, error))
+
+# Paints the SVG with QtSvg straight into an in-memory PDF: no temp files, no child processes.
+# The parts of a badge that are the same on every badge of a template are parsed once and kept,
+# so only the names, photo and QR code are parsed again for each badge.
+class QtSvgRenderer(object):
+	name = 'qt'
+	description = 'Built-in (QtSvg)'
+	usesLayers = True
+
+	def __init__(self, resolution=300, staticLayers=True, maxStaticLayers=16):
+		self.resolution = resolution
+		self.staticLayers = staticLayers
+		self.maxStaticLayers = maxStaticLayers
+		self.layers = OrderedDict()
+
+	def start(self):
+		pass
+
+	def close(self):
+		pass
+
+	def pageSize(self, content):
+		match = re.search(rb'<svg\b[^>]*>', content)
+		if match is not None:
+			width = re.search(rb'\swidth="([^"]+)"', match.group(0))
+			height = re.search(rb'\sheight="([^"]+)"', match.group(0))
+			if width is not None and height is not None:
+				return (
+					lengthToInches(width.group(1).decode('ascii')),
+					lengthToInches(height.group(1).decode('ascii'))
+				)
+
+		raise RenderError('SVG has no width and height')
+
+	def render(self, content, layers=None):
+		width, height = self.pageSize(content)
+		buffer = QtCore.QBuffer()
+		buffer.open(QtCore.QIODevice.WriteOnly)
+
+		writer = QtGui.QPdfWriter(buffer)
+		writer.setResolution(self.resolution)
+		writer.setPageSize(QtGui.QPageSize(QtCore.QSizeF(width, height), QtGui.QPageSize.Inch))
+		writer.setPageMargins(QtCore.QMarginsF(0, 0, 0, 0))
+
+		painter = QtGui.QPainter(writer)
+		try:
+			self.paint(painter, content, QtCore.QRectF(0, 0, writer.width(), writer.height()), layers)
+		finally:
+			painter.end()
+
+		return bytes(buffer.data())
+
+	def paint(self, painter, content, rect, layers=None):
+		if not self.staticLayers or layers is None or not any(static for static, layer in layers):
+			self._parse(content).render(painter, rect)
+			return
+
+		for static, layer in layers:
+			if static:
+				self._staticLayer(layer).render(painter, rect)
+			else:
+				self._parse(layer).render(painter, rect)
+
+	def _parse(self, content):
+		svg = QtSvg.QSvgRenderer(QtCore.QByteArray(content))
+		if not svg.isValid():
+			raise RenderError('QtSvg could not parse the badge')
+
+		return svg
+
+	# the layer's own bytes are its key, so a template that's been edited gets parsed again
+	def _staticLayer(self, layer):
+		key = hashlib.sha256(layer).digest()
+		svg = self.layers.get(key)
+		if svg is None:
+			svg = self._parse(layer)
+			self.layers[key] = svg
+			if len(self.layers) > self.maxStaticLayers:
+				self.layers.popitem(last=False)
+		else:
+			self.layers.move_to_end(key)
+
+		return svg
+
+RENDERERS = {
+	InkscapeRenderer.name: InkscapeRenderer,
+	InkscapeShellRenderer.name: InkscapeShellRenderer,
+	QtSvgRenderer.name: QtSvgRenderer,
+}
+
+DEFAULT_RENDERER = InkscapeShellRenderer.name
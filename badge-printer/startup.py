@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from PyQt5 import QtCore
+
+import time
+
+# Records how long each phase of starting up took, for --startup-benchmark
+class StartupTimer(object):
+	def __init__(self, startTime=None):
+		self.startTime = time.perf_counter() if startTime is None else startTime
+		self.phases = []
+
+	def mark(self, phase):
+		if phase not in self:
+			self.phases.append((phase, time.perf_counter()))
+
+	def __contains__(self, phase):
+		return phase in (name for name, when in self.phases)
+
+	def report(self):
+		lines = ['%-20s %10s %10s' % ('phase', 'took (ms)', 'at (ms)')]
+		previous = self.startTime
+		for phase, when in sorted(self.phases, key=lambda item: item[1]):
+			lines.append('%-20s %10.1f %10.1f' % (phase, (when - previous) * 1000, (when - self.startTime) * 1000))
+			previous = when
+
+		return '\n'.join(lines)
+
+# Runs a slow function off the GUI thread and reports its result back on the GUI thread
+class BackgroundCall(QtCore.QThread):
+	done = QtCore.pyqtSignal(object)
+	failed = QtCore.pyqtSignal(object)
+
+	def __init__(self, function, parent=None):
+		super().__init__(parent)
+		self.function = function
+
+	def run(self):
+		try:
+			result = self.function()
+		except Exception as exc:
+			self.failed.emit(exc)
+			return
+
+		self.done.emit(result)
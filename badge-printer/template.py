@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, copy, base64
+import xml.etree.ElementTree as ET
+
+from layers import layerRuns, layerDocument
+import textfit
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+XLINK_NS = 'http://www.w3.org/1999/xlink'
+
+XLINK_HREF = '{%s}href' % XLINK_NS
+SODIPODI_ROLE = '{http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd}role'
+
+# ElementTree forgets namespace prefixes, so the ones Inkscape writes are registered for
+# serializing. That's global state, so it's done once here rather than while parsing,
+# which also happens on the print workers. Any other namespace comes out as ns0, ns1...
+NAMESPACES = {
+	'': SVG_NS,
+	'xlink': XLINK_NS,
+	'sodipodi': 'http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd',
+	'inkscape': 'http://www.inkscape.org/namespaces/inkscape',
+	'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+	'cc': 'http://creativecommons.org/ns#',
+	'dc': 'http://purl.org/dc/elements/1.1/',
+	'osb': 'http://www.openswatchbook.org/uri/2009/osb',
+}
+for prefix, uri in NAMESPACES.items():
+	ET.register_namespace(prefix, uri)
+
+def fileFriendlyName(names, replaceBlankWithAnonymous=True):
+	name = '_'.join(n.replace(' ', '_') for n in names if n != '')
+	if replaceBlankWithAnonymous and name == '':
+		name = 'Anonymous_McNameface'
+
+	return name
+
+# CSS units per inch, as used by SVG length attributes
+UNITS_PER_INCH = {
+	'in': 1.0,
+	'cm': 2.54,
+	'mm': 25.4,
+	'pt': 72.0,
+	'pc': 6.0,
+	'px': 96.0,
+	'': 96.0,
+}
+
+def lengthToInches(value):
+	value = value.strip()
+	number = value.rstrip('abcdefghijklmnopqrstuvwxyz%')
+	unit = value[len(number):]
+	if unit not in UNITS_PER_INCH:
+		raise ValueError('Unsupported length: %s' % value)
+
+	return float(number) / UNITS_PER_INCH[unit]
+
+def _tag(element):
+	return element.tag.rsplit('}', 1)[-1] if isinstance(element.tag, str) else ''
+
+def _textContent(element):
+	return ''.join(element.itertext())
+
+def _parse(filename):
+	# Expat starts over on a token that doesn't fit in the chunk it was fed, which gets
+	# quadratic for megabytes of embedded image, so the parsers get the whole file at once
+	with open(filename, 'rb') as templateFile:
+		return parseSVG(templateFile.read())
+
+def parseSVG(data):
+	parser = ET.XMLParser(target=ET.TreeBuilder(insert_comments=True))
+	parser.feed(data)
+	return parser.close()
+
+def _indexElements(root):
+	elements = {}
+	for element in root.iter():
+		id = element.get('id')
+		if id is not None:
+			elements[id] = element
+
+	return elements
+
+def _extractTags(elements, tagName, attributes=[]):
+	result = []
+	for id, element in elements.items():
+		if _tag(element) == tagName:
+			obj = {'id': id}
+			for key in attributes:
+				if key == 'textContent':
+					obj[key] = _textContent(element)
+				else:
+					obj[key] = element.get(key)
+			result.append(obj)
+
+	return result
+
+def _withFontSize(style, size):
+	declarations = [declaration for declaration in style.split(';') if declaration.split(':')[0].strip() not in ('', 'font-size')]
+	return ';'.join(declarations + ['font-size:%.4gpx' % size])
+
+# x and y may list a position for each character, of which the first is where the text starts
+def _firstNumber(value):
+	numbers = (value or '').replace(',', ' ').split()
+	return float(numbers[0]) if len(numbers) > 0 else 0.0
+
+def _moveText(text, line, box, offset):
+	if box['textYAttribute'] is not None:
+		text.set('y', '%g' % (_firstNumber(box['textYAttribute']) + offset))
+	if box['yAttribute'] is not None:
+		line.set('y', '%g' % (box['y'] + offset))
+
+def _serialize(root):
+	return '<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n' + ET.tostring(root, encoding='unicode')
+
+# Everything about a template file that can be worked out once: the parsed
+# tree, its form fields, its image slots and the untouched serialized document.
+class TemplateInfo(object):
+	def __init__(self, path, mtime):
+		self.path = path
+		self.mtime = mtime
+		self.root = _parse(path)
+
+		self.elements = _indexElements(self.root)
+		self.fields = _extractTags(self.elements, 'text', ['textContent'])
+		self.imageSlots = [image['id'] for image in _extractTags(self.elements, 'image')]
+		self.content = _serialize(self.root).encode('utf-8')
+		self._staticLayers = None
+		self.textBoxes = {}
+
+	# How a field's text is drawn and how much room it has, in user units. The room is
+	# data-max-width when the template gives it, otherwise as far as the text can go either
+	# way from its anchor before it's within 5% of the edge of the badge. It wraps onto at
+	# most data-max-lines lines; by default it's only shrunk, since where a second line would
+	# go depends on what else is on the badge.
+	def textBox(self, id):
+		if id not in self.textBoxes:
+			element = self.elements[id]
+			line = element[0] if len(element) > 0 else element
+			style = textfit.parseStyle(element.get('style'))
+			style.update(textfit.parseStyle(line.get('style')))
+			def value(name, default=None):
+				return line.get(name) or style.get(name) or element.get(name) or default
+
+			size = textfit.parseLength(value('font-size')) or 16.0
+			x = _firstNumber(line.get('x') or element.get('x'))
+			y = _firstNumber(line.get('y') or element.get('y'))
+
+			maxWidth = textfit.parseLength(element.get('data-max-width'))
+			if maxWidth is None:
+				viewBox = self.root.get('viewBox')
+				if viewBox is not None:
+					left, top, width = [float(number) for number in viewBox.replace(',', ' ').split()[:3]]
+				else:
+					left, width = 0.0, textfit.parseLength(self.root.get('width')) or 0.0
+				margin = width * 0.05
+				anchor = value('text-anchor', 'start')
+				if anchor == 'middle':
+					maxWidth = 2 * min(x - left - margin, left + width - margin - x)
+				elif anchor == 'end':
+					maxWidth = x - left - margin
+				else:
+					maxWidth = left + width - margin - x
+
+			weight = value('font-weight', 'normal')
+			self.textBoxes[id] = {
+				'font': textfit.font(
+					value('font-family', 'sans-serif').split(',')[0].strip().strip('\'"'),
+					weight in ('bold', 'bolder') or (weight.isdigit() and int(weight) >= 600),
+					value('font-style', 'normal') in ('italic', 'oblique')
+				),
+				'size': size,
+				'x': x,
+				'y': y,
+				'maxWidth': max(maxWidth, 0.0),
+				'maxLines': int(element.get('data-max-lines') or 1),
+				'letterSpacing': textfit.parseLength(value('letter-spacing', '0'), size) or 0.0,
+				'lineHeight': textfit.parseLineHeight(style.get('line-height'), size),
+				'style': line.get('style') or '',
+				'yAttribute': line.get('y'),
+				'textYAttribute': element.get('y') if line is not element else None,
+			}
+
+		return self.textBoxes[id]
+
+	# The artwork that's the same on every badge, as one serialized document per run of it
+	# between the names, photo and QR code, or None where a run changes from badge to badge
+	def staticLayers(self):
+		if self._staticLayers is None:
+			shared, runs = layerRuns(self.root)
+			self._staticLayers = [layerDocument(self.root, shared + units) if static else None for static, units in runs]
+
+		return self._staticLayers
+
+class TemplateRegistry(object):
+	def __init__(self):
+		self.templates = {}
+
+	# returns the cached TemplateInfo, re-parsing only when the file has changed on disk
+	def get(self, filename):
+		path = os.path.abspath(filename)
+		mtime = os.stat(path).st_mtime_ns
+
+		info = self.templates.get(path)
+		if info is None or info.mtime != mtime:
+			info = TemplateInfo(path, mtime)
+			self.templates[path] = info
+
+		return info
+
+	def remove(self, filename):
+		self.templates.pop(os.path.abspath(filename), None)
+
+registry = TemplateRegistry()
+
+# With fitText, text that's too wide for its field is shrunk or wrapped to fit (see textfit.fit)
+class BadgeTemplate(object):
+	def __init__(self, filename, fitText=True):
+		self.filename = filename
+		self.info = registry.get(filename)
+		self.root = copy.deepcopy(self.info.root)
+		self.elements = _indexElements(self.root)
+		self.images = {}
+		self.modified = False
+		self.fitText = fitText
+		self.extraLines = {}
+
+	def extractTags(self, tagName, attributes=[]):
+		return _extractTags(self.elements, tagName, attributes)
+
+	def fields(self):
+		return [dict(field) for field in self.info.fields]
+
+	# size of the user coordinate system's unit, from the root's width and viewBox
+	def inchesPerUserUnit(self):
+		viewBox = self.root.get('viewBox')
+		width = self.root.get('width')
+		if viewBox is None or width is None:
+			return 1.0 / UNITS_PER_INCH['px']
+
+		return lengthToInches(width) / float(viewBox.replace(',', ' ').split()[2])
+
+	# (width, height) of an element's box in inches; transforms on the way down are not applied.
+	# None when the box isn't given as plain numbers, e.g. an <image> that's sized by its picture.
+	def elementSize(self, id):
+		element = self.elements[id]
+		scale = self.inchesPerUserUnit()
+		try:
+			return (float(element.get('width')) * scale, float(element.get('height')) * scale)
+		except (TypeError, ValueError):
+			return None
+
+	def hasElement(self, id):
+		return id in self.elements
+
+	def setText(self, id, text):
+		element = self.elements.get(id)
+		if element is None:
+			return
+
+		for parent, extraLine in self.extraLines.pop(id, []):
+			parent.remove(extraLine)
+
+		# mirror the DOM's el.firstChild.textContent = text
+		if element.text or len(element) == 0:
+			line = element
+		else:
+			line = element[0]
+			for grandchild in list(line):
+				line.remove(grandchild)
+		line.text = text
+
+		if self.fitText:
+			self._fitText(id, element, line, text)
+
+		self.modified = True
+
+	def _fitText(self, id, element, line, text):
+		box = self.info.textBox(id)
+		lines, size = textfit.fit(
+			text, box['font'], box['size'], box['maxWidth'],
+			maxLines=box['maxLines'] if line is not element else 1, letterSpacing=box['letterSpacing']
+		)
+
+		# text that fits is left exactly as the template has it
+		if size == box['size']:
+			if box['style']:
+				line.set('style', box['style'])
+		else:
+			line.set('style', _withFontSize(box['style'], size))
+
+		if len(lines) == 1:
+			return
+
+		# Each extra line is a <text> of its own below the first, since renderers like Qt's
+		# ignore where a <tspan> is put
+		lineHeight = box['lineHeight'] * size / box['size']
+		parent = next(parent for parent in self.root.iter() if any(child is element for child in parent))
+		index = list(parent).index(element)
+
+		line.text = lines[0]
+		self.extraLines[id] = []
+		for i in range(1, len(lines)):
+			extraText = ET.Element(element.tag, dict((name, value) for name, value in element.attrib.items() if name not in ('id', 'title')))
+			extraText.set('data-line-of', id)
+			extraText.text = element.text
+			extraText.tail = element.tail
+			extraLine = ET.SubElement(extraText, line.tag, dict((name, value) for name, value in line.attrib.items() if name not in ('id', SODIPODI_ROLE)))
+			extraLine.text = lines[i]
+			_moveText(extraText, extraLine, box, i * lineHeight)
+
+			parent.insert(index + i, extraText)
+			self.extraLines[id].append((parent, extraText))
+
+	# A text field and any lines it was wrapped onto, for putting straight into the preview
+	def textMarkup(self, id):
+		element = self.elements.get(id)
+		if element is None:
+			return None
+
+		texts = [element] + [extraText for parent, extraText in self.extraLines.get(id, [])]
+		return ''.join(ET.tostring(text, encoding='unicode') for text in texts)
+
+	#	type should be "png" or "jpeg"
+	def setImage(self, id, data, imageType):
+		element = self.elements.get(id)
+		if element is None:
+			return
+
+		element.set(XLINK_HREF, 'data:image/%s;base64,%s' % (imageType, base64.b64encode(data).decode('ascii')))
+		self.images[id] = (data, imageType)
+		self.modified = True
+
+	def imageHref(self, id):
+		element = self.elements.get(id)
+		return element.get(XLINK_HREF) if element is not None else None
+
+	# With an asset store, substituted images are saved there and linked
+	# by a path relative to relativeTo instead of being inlined.
+	def toString(self, assets=None, relativeTo='.'):
+		if assets is not None and len(self.images) > 0:
+			return self._linkedString(assets, relativeTo)
+
+		if not self.modified:
+			return self.info.content.decode('utf-8')
+
+		return _serialize(self.root)
+
+	def _linkedString(self, assets, relativeTo):
+		inlined = {}
+		try:
+			for id, (data, imageType) in self.images.items():
+				element = self.elements[id]
+				inlined[id] = element.get(XLINK_HREF)
+				path = os.path.relpath(assets.put(data, imageType), relativeTo)
+				element.set(XLINK_HREF, path.replace(os.sep, '/'))
+
+			return _serialize(self.root)
+		finally:
+			for id, href in inlined.items():
+				self.elements[id].set(XLINK_HREF, href)
+
+	# the badge as layers that, painted in order, look the same as toBytes(): (static, document)
+	def layers(self):
+		shared, runs = layerRuns(self.root)
+		staticLayers = self.info.staticLayers()
+		return [
+			(True, staticLayers[i]) if static else (False, layerDocument(self.root, shared + units))
+			for i, (static, units) in enumerate(runs)
+		]
+
+	def toBytes(self):
+		if not self.modified:
+			return self.info.content
+
+		return self.toString().encode('utf-8')
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from PyQt5 import QtCore
+
+import os
+
+from template import registry
+
+# Watches a template directory and reports which SVGs were added, removed or changed
+class TemplateDirectoryWatcher(QtCore.QObject):
+	templateAdded = QtCore.pyqtSignal(str)
+	templateRemoved = QtCore.pyqtSignal(str)
+	templateChanged = QtCore.pyqtSignal(str)
+
+	def __init__(self, directory, parent=None):
+		super().__init__(parent)
+		self.directory = directory
+		self.known = {}
+
+		self.watcher = QtCore.QFileSystemWatcher(self)
+		self.watcher.directoryChanged.connect(self._scheduleRescan)
+		self.watcher.fileChanged.connect(self._scheduleRescan)
+
+		# editors tend to save in several steps, so wait for things to settle
+		self.rescanTimer = QtCore.QTimer(self)
+		self.rescanTimer.setSingleShot(True)
+		self.rescanTimer.setInterval(200)
+		self.rescanTimer.timeout.connect(self.rescan)
+
+		if os.path.isdir(directory):
+			self.watcher.addPath(directory)
+		self.known = self._scan()
+		self._watchFiles()
+
+	def templates(self):
+		return sorted(self.known)
+
+	def _scan(self):
+		found = {}
+		try:
+			for filename in os.listdir(self.directory):
+				if filename[-4:].lower() == '.svg':
+					try:
+						found[filename] = os.stat(os.path.join(self.directory, filename)).st_mtime_ns
+					except OSError:
+						pass # removed while we were looking
+		except OSError:
+			pass
+
+		return found
+
+	def _watchFiles(self):
+		# Inkscape saves by replacing the file, which drops it from the watch list
+		watched = set(self.watcher.files())
+		for filename in self.known:
+			path = os.path.join(self.directory, filename)
+			if path not in watched:
+				self.watcher.addPath(path)
+
+	def _scheduleRescan(self, path):
+		self.rescanTimer.start()
+
+	def rescan(self):
+		found = self._scan()
+		previous = self.known
+		self.known = found
+		self._watchFiles()
+
+		for filename in sorted(previous):
+			if filename not in found:
+				registry.remove(os.path.join(self.directory, filename))
+				self.templateRemoved.emit(filename)
+
+		for filename in sorted(found):
+			if filename not in previous:
+				self.templateAdded.emit(filename)
+			elif found[filename] != previous[filename]:
+				self.templateChanged.emit(filename)
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, re, struct, subprocess, threading
+
+# Text measurement for fitting names into their space on the badge, without a browser or a
+# QApplication, so batch mode can use it too. Advances come straight from the font file's
+# hmtx table and are kept per font and character. Kerning is not applied, which makes
+# measurements a little wide at worst.
+
+# what an unreadable or missing font is measured as, in ems per character
+FALLBACK_ADVANCE = 0.6
+
+FONT_DIRECTORIES = [
+	'/usr/share/fonts',
+	'/usr/local/share/fonts',
+	os.path.expanduser('~/.fonts'),
+	os.path.expanduser('~/.local/share/fonts'),
+	'/Library/Fonts',
+	'/System/Library/Fonts',
+	os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'),
+]
+
+FALLBACK_FAMILIES = ['liberation sans', 'arial', 'dejavu sans', 'helvetica', 'freesans']
+
+class FontFile(object):
+	def __init__(self, path, index=0):
+		self.path = path
+		with open(path, 'rb') as fontFile:
+			self.data = fontFile.read()
+
+		offset = 0
+		if self.data[:4] == b'ttcf':
+			offset = struct.unpack_from('>I', self.data, 12 + 4 * index)[0]
+
+		self.tables = {}
+		numTables = struct.unpack_from('>H', self.data, offset + 4)[0]
+		for i in range(numTables):
+			tag, checksum, tableOffset, length = struct.unpack_from('>4sIII', self.data, offset + 12 + 16 * i)
+			self.tables[tag.decode('latin-1')] = tableOffset
+
+		head = self.tables['head']
+		self.unitsPerEm = struct.unpack_from('>H', self.data, head + 18)[0]
+		macStyle = struct.unpack_from('>H', self.data, head + 44)[0]
+		self.bold = bool(macStyle & 1)
+		self.italic = bool(macStyle & 2)
+		self.numberOfHMetrics = struct.unpack_from('>H', self.data, self.tables['hhea'] + 34)[0]
+		self.cmap = self._findCmap()
+		self.advances = {}
+
+	def _findCmap(self):
+		cmap = self.tables['cmap']
+		subtables = {}
+		for i in range(struct.unpack_from('>H', self.data, cmap + 2)[0]):
+			platform, encoding, offset = struct.unpack_from('>HHI', self.data, cmap + 4 + 8 * i)
+			subtables[(platform, encoding)] = cmap + offset
+
+		# full Unicode first, then the Basic Multilingual Plane
+		for key in [(3, 10), (0, 4), (0, 6), (3, 1), (0, 3), (0, 2), (0, 1), (0, 0)]:
+			if key in subtables and struct.unpack_from('>H', self.data, subtables[key])[0] in (4, 12):
+				return subtables[key]
+
+		return None
+
+	def glyph(self, codepoint):
+		if self.cmap is None:
+			return 0
+
+		format = struct.unpack_from('>H', self.data, self.cmap)[0]
+		if format == 12:
+			groups = struct.unpack_from('>I', self.data, self.cmap + 12)[0]
+			low, high = 0, groups - 1
+			while low <= high:
+				middle = (low + high) // 2
+				start, end, startGlyph = struct.unpack_from('>III', self.data, self.cmap + 16 + 12 * middle)
+				if codepoint < start:
+					high = middle - 1
+				elif codepoint > end:
+					low = middle + 1
+				else:
+					return startGlyph + codepoint - start
+			return 0
+
+		if codepoint > 0xffff:
+			return 0
+
+		segCount = struct.unpack_from('>H', self.data, self.cmap + 6)[0] // 2
+		endCodes = self.cmap + 14
+		startCodes = endCodes + 2 * segCount + 2
+		idDeltas = startCodes + 2 * segCount
+		idRangeOffsets = idDeltas + 2 * segCount
+		for i in range(segCount):
+			if struct.unpack_from('>H', self.data, endCodes + 2 * i)[0] >= codepoint:
+				break
+		else:
+			return 0
+
+		start = struct.unpack_from('>H', self.data, startCodes + 2 * i)[0]
+		if codepoint < start:
+			return 0
+
+		delta = struct.unpack_from('>h', self.data, idDeltas + 2 * i)[0]
+		rangeOffset = struct.unpack_from('>H', self.data, idRangeOffsets + 2 * i)[0]
+		if rangeOffset == 0:
+			return (codepoint + delta) & 0xffff
+
+		glyph = struct.unpack_from('>H', self.data, idRangeOffsets + 2 * i + rangeOffset + 2 * (codepoint - start))[0]
+		return (glyph + delta) & 0xffff if glyph != 0 else 0
+
+	# in ems
+	def advance(self, char):
+		advance = self.advances.get(char)
+		if advance is None:
+			glyph = min(self.glyph(ord(char)), self.numberOfHMetrics - 1)
+			units = struct.unpack_from('>H', self.data, self.tables['hmtx'] + 4 * glyph)[0]
+			advance = self.advances[char] = units / self.unitsPerEm
+
+		return advance
+
+	# (family, subfamily), preferring the typographic names that group all weights together
+	def names(self):
+		name = self.tables.get('name')
+		if name is None:
+			return None, None
+
+		count, stringOffset = struct.unpack_from('>HH', self.data, name + 2)
+		found = {}
+		for i in range(count):
+			platform, encoding, language, nameID, length, offset = struct.unpack_from('>HHHHHH', self.data, name + 6 + 12 * i)
+			if nameID not in (1, 2, 16, 17) or nameID in found:
+				continue
+
+			raw = self.data[name + stringOffset + offset:name + stringOffset + offset + length]
+			if platform in (0, 3):
+				found[nameID] = raw.decode('utf-16-be', 'replace')
+			elif platform == 1 and encoding == 0:
+				found[nameID] = raw.decode('mac-roman', 'replace')
+
+		return found.get(16, found.get(1)), found.get(17, found.get(2))
+
+# Stands in when no font can be found, so layouts still come out the same every time
+class _FallbackFont(object):
+	path = None
+
+	def advance(self, char):
+		return FALLBACK_ADVANCE
+
+_fonts = {}
+_installedFonts = None
+_lock = threading.Lock()
+
+def _fcMatch(family, bold, italic):
+	pattern = family + (':bold' if bold else '') + (':italic' if italic else '')
+	try:
+		output = subprocess.check_output(
+			['fc-match', '-f', '%{file}\n%{index}', pattern], stderr=subprocess.DEVNULL, timeout=10
+		).decode('utf-8', 'replace').split('\n')
+		return output[0], int(output[1] or 0)
+	except (OSError, subprocess.SubprocessError, ValueError, IndexError):
+		return None
+
+# without fontconfig, look through the usual font directories ourselves
+def _scanFonts():
+	global _installedFonts
+	if _installedFonts is None:
+		_installedFonts = {}
+		for directory in FONT_DIRECTORIES:
+			for path, dirs, files in os.walk(directory):
+				for filename in sorted(files):
+					if os.path.splitext(filename)[1].lower() not in ('.ttf', '.otf'):
+						continue
+					try:
+						font = FontFile(os.path.join(path, filename))
+						family = font.names()[0]
+					except Exception:
+						continue
+					if family is not None:
+						_installedFonts.setdefault((family.lower(), font.bold, font.italic), (font.path, 0))
+
+	return _installedFonts
+
+def _findFont(family, bold, italic):
+	match = _fcMatch(family, bold, italic)
+	if match is not None:
+		return match
+
+	installed = _scanFonts()
+	for name in [family.lower()] + FALLBACK_FAMILIES:
+		for style in [(bold, italic), (bold, False), (False, italic), (False, False)]:
+			if (name,) + style in installed:
+				return installed[(name,) + style]
+
+	return None
+
+def font(family, bold=False, italic=False):
+	key = (family, bold, italic)
+	with _lock:
+		if key not in _fonts:
+			found = _findFont(family, bold, italic)
+			try:
+				_fonts[key] = FontFile(*found) if found is not None else _FallbackFont()
+			except Exception:
+				_fonts[key] = _FallbackFont()
+
+		return _fonts[key]
+
+def measure(text, fontFile, size, letterSpacing=0.0):
+	return sum(fontFile.advance(char) for char in text) * size + letterSpacing * len(text)
+
+# Picks how to show text in maxWidth: as one line, shrunk if need be, or (with maxLines of 2)
+# wrapped onto two lines when shrinking alone would take it below minScale of its size.
+# Returns (lines, size).
+def fit(text, fontFile, size, maxWidth, maxLines=1, minScale=0.6, letterSpacing=0.0):
+	width = measure(text, fontFile, size, letterSpacing)
+	if width <= maxWidth or width == 0:
+		return [text], size
+
+	shrunk = size * maxWidth / width
+	words = text.split(' ')
+	if shrunk >= size * minScale or maxLines < 2 or len(words) < 2:
+		return [text], shrunk
+
+	# the most even split into two lines, so the text can stay as large as possible
+	best = None
+	for i in range(1, len(words)):
+		lines = [' '.join(words[:i]), ' '.join(words[i:])]
+		widest = max(measure(line, fontFile, size, letterSpacing) for line in lines)
+		if best is None or widest < best[0]:
+			best = (widest, lines)
+
+	wrapped = min(size, size * maxWidth / best[0])
+	if wrapped <= shrunk:
+		return [text], shrunk
+
+	return best[1], wrapped
+
+_lengthPattern = re.compile(r'^\s*([-+]?[\d.]+(?:e[-+]?\d+)?)\s*([a-z%]*)\s*$')
+
+# a CSS length in px, or None
+def parseLength(value, fontSize=None):
+	match = _lengthPattern.match(value or '')
+	if match is None:
+		return None
+
+	number, unit = float(match.group(1)), match.group(2)
+	if unit in ('', 'px'):
+		return number
+	if unit == 'pt':
+		return number * 96.0 / 72.0
+	if unit == 'em' and fontSize is not None:
+		return number * fontSize
+	if unit == 'mm':
+		return number * 96.0 / 25.4
+	if unit == 'in':
+		return number * 96.0
+
+	return None
+
+# line-height may be a multiple of the font size, a percentage or a length
+def parseLineHeight(value, fontSize):
+	value = (value or '').strip()
+	try:
+		if value.endswith('%'):
+			lineHeight = float(value[:-1]) / 100 * fontSize
+		elif re.match(r'^[\d.]+$', value):
+			lineHeight = float(value) * fontSize
+		else:
+			lineHeight = parseLength(value, fontSize)
+	except ValueError:
+		lineHeight = None
+
+	# Inkscape puts 0% on the <text> and the real value on its lines
+	return lineHeight if lineHeight else 1.25 * fontSize
+
+def parseStyle(style):
+	values = {}
+	for declaration in (style or '').split(';'):
+		if ':' in declaration:
+			name, value = declaration.split(':', 1)
+			values[name.strip()] = value.strip()
+
+	return values
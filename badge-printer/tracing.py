@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, time, json, threading, functools
+from collections import deque
+
+# Spans that are timed across threads, for finding out where the time between
+# pressing Enter and paper coming out goes. While disabled, span() hands out a
+# shared do-nothing span, so instrumented code pays for little more than a call.
+
+class _Span(object):
+	__slots__ = ('tracer', 'name', 'args', 'start')
+
+	def __init__(self, tracer, name, args):
+		self.tracer = tracer
+		self.name = name
+		self.args = args
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, excType, exc, tb):
+		if excType is not None:
+			self.args['error'] = str(exc)
+		self.tracer.record(self.name, self.start, time.perf_counter(), self.args)
+		return False
+
+class _NoSpan(object):
+	__slots__ = ()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, exc, tb):
+		return False
+
+_noSpan = _NoSpan()
+
+class Tracer(object):
+	def __init__(self, maxEvents=50000, window=1000):
+		self.enabled = False
+		self.window = window
+		self.lock = threading.Lock()
+		self.events = deque(maxlen=maxEvents)
+		self.durations = {}
+		self.threadNames = {}
+		self.origin = time.perf_counter()
+
+	def enable(self, enabled=True):
+		self.enabled = enabled
+
+	def reset(self):
+		with self.lock:
+			self.events.clear()
+			self.durations = {}
+			self.threadNames = {}
+
+	def span(self, name, **args):
+		if not self.enabled:
+			return _noSpan
+		return _Span(self, name, args)
+
+	# for functions that are always worth timing as a whole
+	def traced(self, name):
+		def decorator(function):
+			@functools.wraps(function)
+			def wrapper(*args, **kwargs):
+				if not self.enabled:
+					return function(*args, **kwargs)
+				with _Span(self, name, {}):
+					return function(*args, **kwargs)
+			return wrapper
+		return decorator
+
+	# start and end come from time.perf_counter(). Spans that begin on one thread and
+	# end on another, like a whole print job, pass an id to be shown as their own track.
+	def record(self, name, start, end, args=None, id=None):
+		if not self.enabled:
+			return
+
+		thread = threading.current_thread()
+		with self.lock:
+			self.threadNames[thread.ident] = thread.name
+			self.events.append((name, start, end, thread.ident, args or {}, id))
+			if name not in self.durations:
+				self.durations[name] = deque(maxlen=self.window)
+			self.durations[name].append(end - start)
+
+	# (name, count, p50, p95, max) in milliseconds, over the most recent spans of each name
+	def statistics(self):
+		with self.lock:
+			durations = dict((name, sorted(values)) for name, values in self.durations.items())
+
+		def percentile(values, fraction):
+			return values[min(len(values) - 1, int(fraction * len(values)))] * 1000
+
+		return [
+			(name, len(values), percentile(values, 0.50), percentile(values, 0.95), values[-1] * 1000)
+			for name, values in sorted(durations.items())
+		]
+
+	# Chrome trace event format, for chrome://tracing or https://ui.perfetto.dev
+	def chromeTrace(self):
+		with self.lock:
+			events = list(self.events)
+			threadNames = dict(self.threadNames)
+
+		pid = os.getpid()
+		traceEvents = [
+			{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+			for tid, name in threadNames.items()
+		]
+		for name, start, end, tid, args, id in events:
+			timestamp = (start - self.origin) * 1e6
+			if id is None:
+				traceEvents.append({
+					'name': name, 'cat': 'badge-printer', 'ph': 'X', 'pid': pid, 'tid': tid,
+					'ts': timestamp, 'dur': (end - start) * 1e6, 'args': args,
+				})
+			else:
+				traceEvents.append({
+					'name': name, 'cat': 'badge-printer', 'ph': 'b', 'pid': pid, 'tid': tid,
+					'ts': timestamp, 'id': id, 'args': args,
+				})
+				traceEvents.append({
+					'name': name, 'cat': 'badge-printer', 'ph': 'e', 'pid': pid, 'tid': tid,
+					'ts': (end - self.origin) * 1e6, 'id': id,
+				})
+
+		return {'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}
+
+	def export(self, filename):
+		with open(filename, 'w') as traceFile:
+			json.dump(self.chromeTrace(), traceFile)
+
+tracer = Tracer()
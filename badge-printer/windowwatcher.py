@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re, select, subprocess, time
+
+try:
+	from Xlib import X, Xatom, display as xdisplay
+	from Xlib.error import XError
+except ImportError:
+	xdisplay = None
+
+# Waits for top-level windows to appear and hides them.
+# Uses X11 property notifications when python-xlib is installed, otherwise polls wmctrl.
+class WindowWatcher(object):
+	def __init__(self, displayName=None):
+		self.displayName = displayName
+		self.display = None
+
+		if xdisplay is not None:
+			try:
+				self.display = xdisplay.Display(displayName)
+			except Exception as exc:
+				print('Could not connect to X display, falling back to wmctrl: %s' % exc)
+
+	def close(self):
+		if self.display is not None:
+			self.display.close()
+			self.display = None
+
+	def waitForWindow(self, pid, titlePattern, timeout=10.0):
+		if self.display is not None:
+			return self._waitForWindowX(pid, titlePattern, timeout)
+		else:
+			return self._waitForWindowPolling(pid, titlePattern, timeout)
+
+	def findWindow(self, pid, titlePattern):
+		pattern = re.compile(titlePattern)
+		for windowID, windowPID, title in self.listWindows():
+			if windowPID == pid and pattern.search(title):
+				return windowID
+
+		return None
+
+	def hideWindow(self, windowID):
+		if self.display is not None:
+			self.display.create_resource_object('window', windowID).unmap()
+			self.display.sync()
+		else:
+			subprocess.call(['xdotool', 'windowunmap', str(windowID)])
+
+	def listWindows(self):
+		if self.display is not None:
+			return self._listWindowsX()
+		else:
+			return self._listWindowsWmctrl()
+
+	def _atom(self, name):
+		return self.display.intern_atom(name)
+
+	def _listWindowsX(self):
+		root = self.display.screen().root
+		clientList = root.get_full_property(self._atom('_NET_CLIENT_LIST'), Xatom.WINDOW)
+		if clientList is None:
+			return []
+
+		windows = []
+		for windowID in clientList.value:
+			window = self.display.create_resource_object('window', windowID)
+			try:
+				pid = window.get_full_property(self._atom('_NET_WM_PID'), Xatom.CARDINAL)
+				name = window.get_full_property(self._atom('_NET_WM_NAME'), self._atom('UTF8_STRING'))
+				if name is None:
+					name = window.get_full_property(Xatom.WM_NAME, Xatom.STRING)
+			except XError:
+				# the window went away while we were looking at it
+				continue
+
+			title = name.value if name is not None else b''
+			if isinstance(title, bytes):
+				title = title.decode('utf-8', 'replace')
+
+			windows.append((windowID, pid.value[0] if pid is not None else None, title))
+
+		return windows
+
+	def _waitForWindowX(self, pid, titlePattern, timeout):
+		deadline = time.time() + timeout
+		root = self.display.screen().root
+		root.change_attributes(event_mask=X.PropertyChangeMask | X.SubstructureNotifyMask)
+		self.display.sync()
+
+		watched = set()
+		while True:
+			windowID = self.findWindow(pid, titlePattern)
+			if windowID is not None:
+				return windowID
+
+			# titles are often set after a window is mapped, so watch each new window's properties too
+			watching = len(watched)
+			for otherID, otherPID, title in self._listWindowsX():
+				if otherPID == pid and otherID not in watched:
+					watched.add(otherID)
+					window = self.display.create_resource_object('window', otherID)
+					window.change_attributes(event_mask=X.PropertyChangeMask)
+			self.display.sync()
+			if len(watched) > watching:
+				# a title set before the watch started wouldn't send an event, so look again
+				continue
+
+			remaining = deadline - time.time()
+			if remaining <= 0:
+				return None
+
+			if self.display.pending_events() == 0:
+				if not select.select([self.display.fileno()], [], [], remaining)[0]:
+					return None
+
+			# drain everything that arrived, then re-check once
+			while self.display.pending_events() > 0:
+				self.display.next_event()
+
+	def _listWindowsWmctrl(self):
+		try:
+			output = subprocess.check_output(['wmctrl', '-lp'], stderr=subprocess.DEVNULL)
+		except Exception:
+			return []
+
+		windows = []
+		for line in output.decode('utf-8', 'replace').splitlines():
+			parts = line.split(None, 4)
+			if len(parts) >= 4:
+				windows.append((int(parts[0], 16), int(parts[2]), parts[4] if len(parts) > 4 else ''))
+
+		return windows
+
+	def _waitForWindowPolling(self, pid, titlePattern, timeout):
+		deadline = time.time() + timeout
+		interval = 0.01
+		while time.time() < deadline:
+			windowID = self.findWindow(pid, titlePattern)
+			if windowID is not None:
+				return windowID
+
+			time.sleep(min(interval, max(0, deadline - time.time())))
+			interval = min(interval * 2, 0.25)
+
+		return None